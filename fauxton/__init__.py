@@ -1,3 +1,6 @@
 from _core import *
 from _scene import *
 from _camera import *
+from _cache import *
+from _dataset import *
+from _pool import *
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from os import listdir, makedirs, remove, utime
+from os.path import exists, getmtime, getsize, join
+from threading import RLock
+
+from numpy import load, save, savez
+
+__name__ = 'fauxton'
+__all__ = ['RenderCache']
+
+#===============================================================================
+# Private Symbols
+#===============================================================================
+
+def get_size(image):
+    if isinstance(image, dict):
+        return sum(i.nbytes for i in image.values())
+    return image.nbytes
+
+def freeze(image):
+    if isinstance(image, dict):
+        return {k: freeze(v) for k, v in image.items()}
+    image = image.copy()
+    image.flags.writeable = False
+    return image
+
+def write_image(path, image):
+    if isinstance(image, dict):
+        savez(path + '.npz', **image)
+        return path + '.npz'
+    save(path + '.npy', image)
+    return path + '.npy'
+
+def read_image(path):
+    if path.endswith('.npz'):
+        with load(path) as images:
+            return freeze({k: images[k] for k in images.files})
+    return freeze(load(path))
+
+#===============================================================================
+# Public Symbols
+#===============================================================================
+
+class RenderCache(object):
+    '''
+    A size-bounded store of rendered images, keyed by the state of the scene
+    they depict.
+
+    Images are evicted least-recently-used first. Evicted images are moved
+    to a directory on disk if `path` is given, and dropped otherwise. Images
+    returned from the cache are read-only.
+
+    :param int size: Maximum number of bytes of images to hold in memory.
+    :param str path: Directory to store images evicted from memory in.
+    :param int disk_size: Maximum number of bytes of images to store on disk.
+
+    :var int hits: Number of lookups that found an image.
+    :var int disk_hits: Number of those lookups that found it on disk.
+    :var int misses: Number of lookups that did not find an image.
+    '''
+    def __init__(self, size=2**28, path=None, disk_size=2**32):
+        self.size = size
+        self.path = path
+        self.disk_size = disk_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = RLock()
+        self._images = OrderedDict()
+        self._memory_usage = 0
+        self._files = OrderedDict()
+        self._disk_usage = 0
+        if path is not None and not exists(path):
+            makedirs(path)
+        if path is not None:
+            names = [n for n in listdir(path) if n.endswith(('.npy', '.npz'))]
+            for name in sorted(names, key=lambda n: getmtime(join(path, n))):
+                self._files[name[:-4]] = join(path, name)
+                self._disk_usage += getsize(join(path, name))
+
+    def __len__(self):
+        with self._lock:
+            return len(set(self._images) | set(self._files))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._images or key in self._files
+
+    def get(self, key):
+        '''
+        Return the image stored under a key, or `None`.
+
+        :param str key: Digest of the rendered state.
+        :rtype: numpy.ndarray or dict
+        '''
+        with self._lock:
+            if key in self._images:
+                self.hits += 1
+                image = self._images.pop(key)
+                self._images[key] = image
+                return image
+            if key in self._files:
+                self.hits += 1
+                self.disk_hits += 1
+                file_path = self._files.pop(key)
+                self._files[key] = file_path
+                utime(file_path, None)
+                image = read_image(file_path)
+                self._hold(key, image)
+                return image
+            self.misses += 1
+            return None
+
+    def put(self, key, image):
+        '''
+        Store a copy of an image under a key.
+
+        :param str key: Digest of the rendered state.
+        :param image: A `numpy.ndarray`, or a dictionary of them.
+        '''
+        with self._lock:
+            if key not in self._images:
+                self._hold(key, freeze(image))
+
+    def clear(self):
+        '''
+        Remove every image from the cache, including those on disk.
+        '''
+        with self._lock:
+            for file_path in self._files.values():
+                remove(file_path)
+            self._images.clear()
+            self._files.clear()
+            self._memory_usage = 0
+            self._disk_usage = 0
+
+    def _hold(self, key, image):
+        self._images[key] = image
+        self._memory_usage += get_size(image)
+        while self._memory_usage > self.size and len(self._images) > 0:
+            old_key, old_image = self._images.popitem(last=False)
+            self._memory_usage -= get_size(old_image)
+            if self.path is not None and old_key not in self._files:
+                self._store(old_key, old_image)
+
+    def _store(self, key, image):
+        file_path = write_image(join(self.path, key), image)
+        self._files[key] = file_path
+        self._disk_usage += getsize(file_path)
+        while self._disk_usage > self.disk_size and len(self._files) > 0:
+            old_file_path = self._files.popitem(last=False)[1]
+            self._disk_usage -= getsize(old_file_path)
+            remove(old_file_path)
@@ -1,14 +1,21 @@
-from os.path import dirname
-from shutil import rmtree
-
-try: from cv2 import IMREAD_UNCHANGED, imread
-except ImportError: imread = None
-
-from numpy import (array, arccos, arctan2, cos, cross, dot, hstack, load, pi,
-                   sin, square, sqrt)
-
-from _core import BlenderModule
-from _scene import Prop
+from atexit import register as at_exit
+from collections import deque
+from functools import partial
+from itertools import count
+from mmap import mmap
+from os import close, statvfs, unlink, write
+from os.path import isdir
+from tempfile import gettempdir, mkstemp
+from threading import Lock
+from weakref import ref
+
+from numpy import (array, arccos, arctan2, cos, cross, dot, hstack, ndarray,
+                   pi, sin, square, sqrt)
+
+from _core import (BlenderError, BlenderModule, accessing_properties,
+                   get_cached, invalidate_properties, set_cached,
+                   set_properties)
+from _scene import POSE_INDEPENDENT_PROPERTIES, Prop
 
 __name__ = 'fauxton'
 __all__ = ['Camera', 'DepthSensor', 'SurfaceNormalSensor', 'VelocitySensor']
@@ -18,14 +25,52 @@ __all__ = ['Camera', 'DepthSensor', 'SurfaceNormalSensor', 'VelocitySensor']
 #===============================================================================
 
 bl_camera = BlenderModule('''
-    from contextlib import contextmanager
-    from os.path import join
+    from contextlib import ExitStack, contextmanager
+    from hashlib import sha1
+    from mmap import mmap
+    from os import listdir, remove, stat
+    from os.path import isfile, join
+    from shutil import rmtree
     from tempfile import mkdtemp
-    from numpy import array, reshape, save
+    from numpy import (arange, array, concatenate, dot, empty, errstate,
+                       flatnonzero, maximum, minimum, nanmax, nanmin,
+                       ndarray, ones, reshape, sqrt, tan, zeros)
+    from numpy.linalg import det, inv
 
+    BOUNDS_MARGIN = 1e-5
     DEFAULT_RESOLUTION = (256, 256)
+    MAX_FRAME_BUFFERS = 4
+
+    NODE_LAYOUT_FIELDS = (
+        'users', 'tag', 'location', 'width', 'width_hidden', 'height',
+        'dimensions', 'select', 'hide', 'show_options', 'show_preview',
+        'show_texture')
+
+    RENDER_PRESETS = {
+        'annotation': {'samples': 1, 'light_bounces': 0, 'denoising': False},
+        'production': {'samples': 128, 'light_bounces': 12, 'denoising': True}}
+
+    RENDER_FIELDS = {
+        'samples': lambda scene, value: [
+            (getattr(scene, 'cycles', None), 'samples', value),
+            (scene.render, 'use_antialiasing', value > 1)],
+        'tile_size': lambda scene, value: [
+            (scene.render, 'tile_x', value),
+            (scene.render, 'tile_y', value)],
+        'threads': lambda scene, value: [
+            (scene.render, 'threads_mode', 'FIXED' if value else 'AUTO'),
+            (scene.render, 'threads', value or scene.render.threads)],
+        'light_bounces': lambda scene, value: [
+            (getattr(scene, 'cycles', None), 'max_bounces', value)],
+        'denoising': lambda scene, value: [
+            (getattr(scene.render.layers[0], 'cycles', None),
+             'use_denoising', bool(value))]}
 
     materials = {}
+    pass_sockets = {}
+    bvh_trees = {}
+    frame_buffers = {}
+    sequences = {}
 
     def create_material(source):
         script_text = bpy.data.texts.new('')
@@ -52,7 +97,10 @@ bl_camera = BlenderModule('''
         material.use_fake_user = True
         return material
 
-    def get_material_name(source):
+    def get_material_name(camera):
+        source = camera.get('source', None)
+        if source is None:
+            return None
         if not source in materials:
             materials[source] = create_material(source)
         return materials[source].name
@@ -60,64 +108,124 @@ bl_camera = BlenderModule('''
     @contextmanager
     def use_material(scene, material_name):
         if material_name is not None:
+            layer = scene.render.layers[0]
             old_horizon_color = scene.world.horizon_color
+            old_material = layer.material_override
             scene.render.engine = 'CYCLES'
             scene.world.horizon_color = (0, 0, 0)
-            new_material = bpy.data.materials[material_name]
-            old_materials = {}
-            for obj in scene.objects:
-                if hasattr(obj.data, 'materials'):
-                    old_materials[obj.name] = list(obj.data.materials)
-                    obj.data.materials.clear()
-                    obj.data.materials.append(new_material)
+            layer.material_override = bpy.data.materials[material_name]
         yield
         if material_name is not None:
             scene.world.horizon_color = old_horizon_color
-            for obj in scene.objects:
-                if hasattr(obj.data, 'materials'):
-                    obj.data.materials.clear()
-                    for material in old_materials[obj.name]:
-                        obj.data.materials.append(material)
-
-    def save_links(links):
-        src = lambda l: (l.from_node, l.from_socket.name)
-        snk = lambda l: (l.to_node, l.to_socket.name)
-        return [src(l) + snk(l) for l in links]
-
-    def load_links(links, link_info):
-        for src_n, src_s, snk_n, snk_s in link_info:
-            src = src_n.outputs[src_s]
-            snk = snk_n.inputs[snk_s]
-            links.new(src, snk)
+            layer.material_override = old_material
+
+    def get_compositor(scene):
+        nodes = scene.node_tree.nodes
+        layer_node = nodes.get('Fauxton Render Layers', None)
+        if layer_node is None:
+            layer_node = nodes.new('CompositorNodeRLayers')
+            layer_node.name = 'Fauxton Render Layers'
+        viewer_node = nodes.get('Fauxton Viewer', None)
+        if viewer_node is None:
+            viewer_node = nodes.new('CompositorNodeViewer')
+            viewer_node.name = 'Fauxton Viewer'
+        is_composite = lambda n: n.bl_idname == 'CompositorNodeComposite'
+        if next(filter(is_composite, nodes), None) is None:
+            composite_node = nodes.new('CompositorNodeComposite')
+            scene.node_tree.links.new(layer_node.outputs['Image'],
+                                      composite_node.inputs['Image'])
+        return layer_node, viewer_node
+
+    def get_pass_socket(layer, layer_node, render_pass_name):
+        attribute = 'use_pass_' + render_pass_name
+        if not hasattr(layer, attribute):
+            raise ValueError('"%s" is not a render pass.' % render_pass_name)
+        if not render_pass_name in pass_sockets:
+            passes = [a for a in dir(layer) if a.startswith('use_pass_')]
+            enabled_passes = [p for p in passes if getattr(layer, p)]
+            for p in passes: setattr(layer, p, False)
+            setattr(layer, attribute, True)
+            pass_sockets[render_pass_name] = next(
+                s.identifier for s in layer_node.outputs if s.enabled)
+            for p in enabled_passes: setattr(layer, p, True)
+        if not getattr(layer, attribute):
+            setattr(layer, attribute, True)
+        return layer_node.outputs[pass_sockets[render_pass_name]]
+
+    @contextmanager
+    def use_pass_outputs(scene, render_pass_names):
+        layer = scene.render.layers[0]
+        for name in render_pass_names:
+            if not hasattr(layer, 'use_pass_' + name):
+                raise ValueError('"%s" is not a render pass.' % name)
+        try: directory = mkdtemp(dir='/dev/shm')
+        except OSError: directory = mkdtemp()
+        scene_use_nodes = scene.use_nodes
+        scene.use_nodes = True
+        nodes = scene.node_tree.nodes
+        links = scene.node_tree.links
+        layer_node = get_compositor(scene)[0]
+        snk_node = nodes.new('CompositorNodeOutputFile')
+        snk_node.base_path = directory
+        snk_node.format.file_format = 'OPEN_EXR'
+        snk_node.format.color_mode = 'RGBA'
+        snk_node.format.color_depth = '32'
+        snk_node.file_slots.clear()
+        for i, name in enumerate(render_pass_names):
+            snk_node.file_slots.new('%d_' % i)
+            links.new(get_pass_socket(layer, layer_node, name),
+                      snk_node.inputs[i])
+        yield directory
+        nodes.remove(snk_node)
+        scene.use_nodes = scene_use_nodes
+        rmtree(directory)
 
     @contextmanager
-    def use_render_pass(scene, render_pass_name):
+    def use_viewer(scene, render_pass_name):
+        scene_use_nodes = scene.use_nodes
+        scene.use_nodes = True
+        nodes = scene.node_tree.nodes
+        is_composite = lambda n: n.bl_idname == 'CompositorNodeComposite'
+        snk_node = next(filter(is_composite, nodes), None)
+        layer_node, viewer_node = get_compositor(scene)
         if render_pass_name is not None:
-            scene_use_nodes = scene.use_nodes
-            scene.use_nodes = True
-            nodes = scene.node_tree.nodes
-            links = scene.node_tree.links
-            layer = scene.render.layers[0]
-            passes = [a for a in dir(layer) if a.startswith('use_pass_')]
-            scene_enabled_passes = [p for p in passes if getattr(layer, p)]
-            scene_node_links = save_links(links)
-            for p in passes: setattr(layer, p, False)
-            setattr(layer, 'use_pass_' + render_pass_name, True)
-            links.clear()
-            is_composite = lambda n: n.bl_idname == 'CompositorNodeComposite'
-            src_node = nodes.new('CompositorNodeRLayers')
-            snk_node = next(filter(is_composite, nodes), None)
-            snk_node = snk_node or nodes.new('CompositorNodeComposite')
-            src_socket = next(s for s in src_node.outputs if s.enabled)
-            snk_socket = snk_node.inputs['Image']
-            links.new(src_socket, snk_socket)
+            src_socket = get_pass_socket(
+                scene.render.layers[0], layer_node, render_pass_name)
+        elif scene_use_nodes and snk_node and snk_node.inputs[0].is_linked:
+            src_socket = snk_node.inputs[0].links[0].from_socket
+        else:
+            src_socket = layer_node.outputs['Image']
+        scene.node_tree.links.new(src_socket, viewer_node.inputs['Image'])
+        nodes.active = viewer_node
         yield
-        if render_pass_name is not None:
-            nodes.remove(src_node)
-            setattr(layer, 'use_pass_' + render_pass_name, False)
-            for p in scene_enabled_passes: setattr(layer, p, True)
-            load_links(links, scene_node_links)
-            scene.use_nodes = scene_use_nodes
+        scene.use_nodes = scene_use_nodes
+
+    def get_frame_buffer(path):
+        status = stat(path)
+        identity = status.st_dev, status.st_ino, status.st_size
+        old_identity, frame_buffer = frame_buffers.get(path, (None, None))
+        if identity != old_identity:
+            if len(frame_buffers) >= MAX_FRAME_BUFFERS:
+                frame_buffers.clear()
+            with open(path, 'r+b') as frame_file:
+                frame_buffer = mmap(frame_file.fileno(), 0)
+            frame_buffers[path] = identity, frame_buffer
+        return frame_buffer
+
+    def read_pixels(image):
+        shape = (image.size[1], image.size[0], 4)
+        return reshape(array(image.pixels[:], 'f'), shape)[::-1]
+
+    def read_pass_outputs(directory, pass_count):
+        pixels = []
+        for i in range(pass_count):
+            prefix = '%d_' % i
+            name = next(f for f in listdir(directory) if f.startswith(prefix))
+            image = bpy.data.images.load(join(directory, name))
+            pixels.append(read_pixels(image))
+            image.user_clear(); bpy.data.images.remove(image)
+            remove(join(directory, name))
+        return array(pixels)
 
     @contextmanager
     def use_render_engine(scene, render_engine_name):
@@ -128,6 +236,28 @@ bl_camera = BlenderModule('''
         if render_engine_name is not None:
             scene.render.engine = scene_render_engine
 
+    def get_render_fields(scene, settings):
+        if isinstance(settings, str):
+            settings = RENDER_PRESETS[settings]
+        fields = []
+        for name, value in settings.items():
+            for struct, attribute, value in RENDER_FIELDS[name](scene, value):
+                if hasattr(struct, attribute):
+                    fields.append((struct, attribute, value))
+        return fields
+
+    @contextmanager
+    def use_render_settings(scene, render_settings):
+        if render_settings is not None:
+            fields = get_render_fields(scene, render_settings)
+            scene_values = [getattr(s, a) for s, a, v in fields]
+            for struct, attribute, value in fields:
+                setattr(struct, attribute, value)
+        yield
+        if render_settings is not None:
+            for (struct, attribute, v), value in zip(fields, scene_values):
+                setattr(struct, attribute, value)
+
     def create(type_):
         camera = bpy.data.objects.new('', bpy.data.cameras.new(''))
         camera['__type__'] = type_
@@ -151,10 +281,9 @@ bl_camera = BlenderModule('''
     def set_source(camera, source):
         if 'source' in camera:
             del camera['source']
-            del camera['material_name']
         if source is not None:
             camera['source'] = source
-            camera['material_name'] = get_material_name(source)
+            get_material_name(camera)
 
     def get_render_pass(camera):
         return camera.get('render_pass', None)
@@ -168,32 +297,520 @@ bl_camera = BlenderModule('''
     def set_render_engine(camera, render_engine):
         camera['render_engine'] = render_engine
 
-    def render(camera, format):
-        try: path = join(mkdtemp(dir='/dev/shm'), 'image.exr')
-        except: path = join(mkdtemp(), 'image.exr')
+    def get_render_settings(camera):
+        render_settings = camera.get('render_settings', None)
+        if hasattr(render_settings, 'to_dict'):
+            return render_settings.to_dict()
+        return render_settings
+
+    def set_render_settings(camera, render_settings):
+        if isinstance(render_settings, str):
+            if not render_settings in RENDER_PRESETS:
+                raise ValueError('"%s" is not a render preset.'
+                                 % render_settings)
+        elif render_settings is not None:
+            for name in render_settings:
+                if not name in RENDER_FIELDS:
+                    raise ValueError('"%s" is not a render setting.' % name)
+        if 'render_settings' in camera:
+            del camera['render_settings']
+        if render_settings is not None:
+            camera['render_settings'] = render_settings
 
+    @contextmanager
+    def use_camera(camera, render_pass_names):
         scene = camera.users_scene[0]
         scene.camera = camera
-        scene.render.filepath = path
-        scene.render.image_settings.file_format = 'OPEN_EXR'
-        scene.render.resolution_y = 2 * get_resolution(camera)[0]
-        scene.render.resolution_x = 2 * get_resolution(camera)[1]
+        scene.render.resolution_y = int(2 * get_resolution(camera)[0])
+        scene.render.resolution_x = int(2 * get_resolution(camera)[1])
         bpy.context.screen.scene = scene
 
-        with use_render_engine(scene, get_render_engine(camera)):
-            with use_render_pass(scene, get_render_pass(camera)):
-                with use_material(scene, camera.get('material_name', None)):
-                    bpy.ops.render.render(write_still=True)
+        with use_render_engine(scene, get_render_engine(camera)), \
+             use_render_settings(scene, get_render_settings(camera)):
+            if render_pass_names is None:
+                with use_viewer(scene, get_render_pass(camera)):
+                    with use_material(scene, get_material_name(camera)):
+                        yield lambda: read_pixels(
+                            bpy.data.images['Viewer Node'])
+            else:
+                with use_pass_outputs(scene, render_pass_names) as directory:
+                    with use_material(scene, get_material_name(camera)):
+                        yield lambda: read_pass_outputs(
+                            directory, len(render_pass_names))
+
+    def deliver(pixels, frame_slot):
+        if frame_slot is not None and len(frame_slot) > 3:
+            pixels = pixels[..., slice(*frame_slot[3])]
+        if frame_slot is None or pixels.nbytes > frame_slot[2]:
+            return pixels
+        path, offset, capacity = frame_slot[:3]
+        frame = ndarray(pixels.shape, 'f', get_frame_buffer(path), offset)
+        frame[...] = pixels
+        return list(pixels.shape)
+
+    def get_mesh_geometry(scene, obj):
+        if len(obj.modifiers) > 0:
+            mesh = obj.to_mesh(scene, True, 'RENDER')
+        else:
+            mesh = obj.data
+        vertices = empty(3 * len(mesh.vertices), 'f')
+        mesh.vertices.foreach_get('co', vertices)
+        loops = empty(len(mesh.loops), 'i')
+        mesh.loops.foreach_get('vertex_index', loops)
+        loop_totals = empty(len(mesh.polygons), 'i')
+        mesh.polygons.foreach_get('loop_total', loop_totals)
+        if mesh is not obj.data:
+            bpy.data.meshes.remove(mesh)
+        return vertices.reshape(-1, 3), loops, loop_totals
+
+    def get_geometry_signature(obj):
+        mesh = obj.data
+        digest = sha1()
+        coordinates = empty(3 * len(mesh.vertices), 'f')
+        mesh.vertices.foreach_get('co', coordinates)
+        digest.update(coordinates.tobytes())
+        loops = empty(len(mesh.loops), 'i')
+        mesh.loops.foreach_get('vertex_index', loops)
+        digest.update(loops.tobytes())
+        state = [mesh.name, len(mesh.polygons), digest.hexdigest()]
+        state.append([get_struct_state(m) for m in obj.modifiers])
+        for modifier in obj.modifiers:
+            for p in modifier.bl_rna.properties:
+                target = getattr(modifier, p.identifier)
+                if isinstance(target, bpy.types.Object):
+                    state.append(get_plain_value(obj.matrix_world))
+                    state.append(get_plain_value(target.matrix_world))
+                    if getattr(target, 'pose', None) is not None:
+                        state.append([get_plain_value(b.matrix)
+                                      for b in target.pose.bones])
+        if getattr(mesh, 'shape_keys', None) is not None:
+            state.append([k.value for k in mesh.shape_keys.key_blocks])
+        return sha1(repr(state).encode()).hexdigest()
+
+    def get_bvh_trees(scene):
+        from mathutils.bvhtree import BVHTree
+        for name in list(bvh_trees):
+            if bpy.data.scenes.get(name) is None:
+                del bvh_trees[name]
+        old_trees = bvh_trees.get(scene.name, {})
+        trees = bvh_trees[scene.name] = {}
+        posed_trees = []
+        for obj in scene.objects:
+            if obj.type != 'MESH' or obj.hide_render:
+                continue
+            signature = get_geometry_signature(obj)
+            old_signature, tree, bounds = old_trees.get(
+                obj.name, (None, None, None))
+            if signature != old_signature:
+                vertices, loops, loop_totals = get_mesh_geometry(scene, obj)
+                loops = loops.tolist()
+                starts = concatenate([[0], loop_totals.cumsum()]).tolist()
+                polygons = [loops[i:j] for i, j in zip(starts[:-1], starts[1:])]
+                tree = BVHTree.FromPolygons(vertices.tolist(), polygons)
+                bounds = get_bounds(vertices)
+            trees[obj.name] = signature, tree, bounds
+            if bounds is not None:
+                posed_trees.append((array(obj.matrix_world), tree, bounds))
+        return posed_trees
+
+    def get_bounds(vertices):
+        if len(vertices) == 0:
+            return None
+        lower, upper = vertices.min(0), vertices.max(0)
+        margin = BOUNDS_MARGIN * (1 + abs(upper - lower).max())
+        return lower - margin, upper + margin
+
+    def intersect_bounds(origin, directions, bounds):
+        with errstate(divide='ignore', invalid='ignore'):
+            reciprocals = 1 / directions
+            lower = (bounds[0] - origin) * reciprocals
+            upper = (bounds[1] - origin) * reciprocals
+        entries = nanmax(minimum(lower, upper), 1)
+        exits = nanmin(maximum(lower, upper), 1)
+        return entries, exits
+
+    def cast_rays(camera, render_pass_names):
+        pass_names = render_pass_names or [get_render_pass(camera)]
+        for name in pass_names:
+            if not name in ('z', 'normal'):
+                raise ValueError('The "%s" pass can\\'t be ray-cast.' % name)
+        scene = camera.users_scene[0]
+        scene.frame_set(scene.frame_current)
+        trees = get_bvh_trees(scene)
+
+        height, width = map(int, get_resolution(camera))
+        extent = 2 * tan(camera.data.angle / 2) / max(height, width)
+        x = (arange(width) + 0.5 - width / 2) * extent
+        y = (height / 2 - arange(height) - 0.5) * extent
+        directions = empty((height, width, 3))
+        directions[:, :, 0] = x
+        directions[:, :, 1] = y[:, None]
+        directions[:, :, 2] = -1
+        directions = directions.reshape(-1, 3)
+        lengths = sqrt((directions ** 2).sum(1))
+        rotation = array(camera.matrix_world.to_3x3().normalized())
+        origin = array(camera.matrix_world.translation)
+        directions = dot(directions / lengths[:, None], rotation.T)
+
+        distances = empty(len(directions))
+        distances[:] = camera.data.clip_end
+        normals = zeros((len(directions), 3))
+        center = lambda t: dot(t[0][:3, :3], sum(t[2]) / 2) + t[0][:3, 3]
+        trees.sort(key=lambda t: ((center(t) - origin) ** 2).sum())
+        for matrix, tree, bounds in trees:
+            if det(matrix[:3, :3]) == 0:
+                continue
+            inverse = inv(matrix)
+            local_origin = dot(inverse[:3, :3], origin) + inverse[:3, 3]
+            local_directions = dot(directions, inverse[:3, :3].T)
+            entries, exits = intersect_bounds(
+                local_origin, local_directions, bounds)
+            indices = flatnonzero((entries <= exits) & (exits >= 0)
+                                  & (entries <= distances))
+            if len(indices) == 0:
+                continue
+            local_origin = tuple(local_origin)
+            scales = sqrt((local_directions[indices] ** 2).sum(1))
+            ray_cast = tree.ray_cast
+            for i, direction, scale in zip(
+                    indices.tolist(), local_directions[indices].tolist(),
+                    scales.tolist()):
+                location, normal, index, distance = ray_cast(
+                    local_origin, direction, distances[i] * scale)
+                if location is not None:
+                    distances[i] = distance / scale
+                    normals[i] = dot(normal, inverse[:3, :3])
+        hits = (normals ** 2).sum(1) > 0
+        depth = empty(len(directions), 'f')
+        depth[:] = 1e10
+        depth[hits] = distances[hits] / lengths[hits]
+        normals[hits] /= sqrt((normals[hits] ** 2).sum(1))[:, None]
+        normals = dot(normals, rotation).astype('f')
+        normals[normals[:, 2] < 0] *= -1
+
+        images = {'z': depth[:, None].repeat(3, 1), 'normal': normals}
+        pixels = ones((len(pass_names), height * width, 4), 'f')
+        for i, name in enumerate(pass_names):
+            pixels[i, :, :3] = images[name]
+        pixels = pixels.reshape(-1, height, width, 4)
+        return pixels if render_pass_names else pixels[0]
 
-        if format == 'exr':
-            return path
+    @contextmanager
+    def use_frames(camera, render_pass_names):
+        if get_render_engine(camera) == 'RAY_CAST':
+            yield lambda: cast_rays(camera, render_pass_names)
         else:
-            image = bpy.data.images.load(path)
-            shape = (image.size[0], image.size[1], 4)
-            save(path[:-3] + 'npy', reshape(array(image.pixels[:], 'f'), shape))
-            image.user_clear(); bpy.data.images.remove(image)
-            return path[:-3] + 'npy'
-  ''')
+            with use_camera(camera, render_pass_names) as read_frame:
+                def take_frame():
+                    bpy.ops.render.render()
+                    return read_frame()
+                yield take_frame
+
+    def suspend_sequence(scene):
+        if scene.name in sequences:
+            sequences.pop(scene.name)[2].close()
+
+    def render(camera, frame_slot, render_pass_names=None):
+        suspend_sequence(camera.users_scene[0])
+        with use_frames(camera, render_pass_names) as take_frame:
+            return deliver(take_frame(), frame_slot)
+
+    def render_sequence_frame(camera, render_pass_names, sequence_id, time,
+                              frame_slot, is_last):
+        scene = camera.users_scene[0]
+        if sequences.get(scene.name, (None,))[0] != sequence_id:
+            suspend_sequence(scene)
+            stack = ExitStack()
+            take_frame = stack.enter_context(
+                use_frames(camera, render_pass_names))
+            sequences[scene.name] = sequence_id, take_frame, stack
+        scene.frame_current = time
+        try:
+            return deliver(sequences[scene.name][1](), frame_slot)
+        except:
+            is_last = True
+            raise
+        finally:
+            if is_last:
+                suspend_sequence(scene)
+
+    def end_sequence(sequence_id):
+        for scene_name, sequence in list(sequences.items()):
+            if sequence[0] == sequence_id:
+                sequences.pop(scene_name)[2].close()
+
+    def get_plain_value(value):
+        if isinstance(value, (set, frozenset)):
+            return sorted(value)
+        for method in ('to_dict', 'to_list'):
+            if hasattr(value, method):
+                return getattr(value, method)()
+        if hasattr(value, '__len__') and not isinstance(value, str):
+            return [get_plain_value(v) for v in value]
+        return value
+
+    def get_struct_state(struct, ignored=('users', 'tag')):
+        state = []
+        for p in struct.bl_rna.properties:
+            is_flag = p.identifier.startswith('is_')
+            is_pointer = p.type in ('POINTER', 'COLLECTION')
+            if not (is_flag or is_pointer or p.identifier in ignored):
+                value = getattr(struct, p.identifier)
+                state.append((p.identifier, get_plain_value(value)))
+        if hasattr(struct, 'keys'):
+            for key in sorted(struct.keys()):
+                state.append((key, get_plain_value(struct[key])))
+        return state
+
+    def get_image_state(image):
+        state = get_struct_state(image)
+        path = bpy.path.abspath(image.filepath_raw, library=image.library)
+        if image.is_dirty:
+            pixels = array(image.pixels[:], 'f')
+            state.append(sha1(pixels.tobytes()).hexdigest())
+        elif image.packed_file is not None:
+            state.append(image.packed_file.size)
+        elif isfile(path):
+            status = stat(path)
+            state.append((status.st_mtime, status.st_size))
+        return state
+
+    def get_node_tree_state(node_tree, visited):
+        is_shown = lambda n: n.bl_idname != 'CompositorNodeViewer'
+        state = [(l.from_node.name, l.from_socket.identifier,
+                  l.to_node.name, l.to_socket.identifier)
+                 for l in node_tree.links if is_shown(l.to_node)]
+        for node in filter(is_shown, node_tree.nodes):
+            state.append((node.bl_idname, node.name,
+                          get_struct_state(node, NODE_LAYOUT_FIELDS),
+                          [get_plain_value(s.default_value)
+                           for s in list(node.inputs) + list(node.outputs)
+                           if hasattr(s, 'default_value')],
+                          get_linked_state(node, visited)))
+        return state
+
+    def get_linked_state(struct, visited):
+        state = []
+        for p in struct.bl_rna.properties:
+            if p.type != 'POINTER' or p.identifier in ('rna_type', 'id_data'):
+                continue
+            value = getattr(struct, p.identifier)
+            if isinstance(value, bpy.types.Image):
+                state.append(get_image_state(value))
+            elif isinstance(value, bpy.types.Text):
+                state.append(value.as_string())
+            elif isinstance(value, (bpy.types.NodeTree, bpy.types.Texture)):
+                key = type(value).__name__, value.name
+                if not key in visited:
+                    visited.add(key)
+                    state.append(get_struct_state(value))
+                    state.append(get_linked_state(value, visited))
+                    if isinstance(value, bpy.types.NodeTree):
+                        state.append(get_node_tree_state(value, visited))
+            elif value is not None and not isinstance(value, bpy.types.ID):
+                state.append(get_struct_state(value))
+        for slot in getattr(struct, 'texture_slots', []):
+            if slot is not None:
+                state.append(get_struct_state(slot))
+                state.append(get_linked_state(slot, visited))
+        return state
+
+    def get_digest(camera, render_pass_names):
+        digest = sha1()
+        update = lambda *values: digest.update(repr(values).encode())
+        scene = camera.users_scene[0]
+        suspend_sequence(scene)
+        update(camera.name, render_pass_names)
+        render_state = get_struct_state(
+            scene.render, ('resolution_x', 'resolution_y'))
+        update(get_struct_state(scene), render_state)
+        update([get_struct_state(l) for l in scene.render.layers])
+        for name in ('view_settings', 'display_settings', 'cycles'):
+            if getattr(scene, name, None) is not None:
+                update(get_struct_state(getattr(scene, name)))
+        visited = set()
+        if scene.use_nodes:
+            update(get_node_tree_state(scene.node_tree, visited))
+        if scene.world is not None:
+            update(get_struct_state(scene.world))
+            update(get_linked_state(scene.world, visited))
+        for obj in sorted(scene.objects, key=lambda o: o.name):
+            update(obj.name, obj.parent and obj.parent.name)
+            update(get_struct_state(obj))
+            update([get_struct_state(m) for m in obj.modifiers])
+            if obj.animation_data and obj.animation_data.action:
+                action = obj.animation_data.action
+                update(get_struct_state(action))
+                for curve in action.fcurves:
+                    update(curve.data_path, curve.array_index,
+                           [(list(k.co), k.interpolation)
+                            for k in curve.keyframe_points])
+            if obj.data is not None:
+                update(get_struct_state(obj.data))
+                if isinstance(obj.data, bpy.types.Mesh):
+                    coordinates = empty(3 * len(obj.data.vertices), 'f')
+                    obj.data.vertices.foreach_get('co', coordinates)
+                    digest.update(coordinates.tobytes())
+                for material in getattr(obj.data, 'materials', []):
+                    if material is not None:
+                        update(get_struct_state(material))
+                        update(get_linked_state(material, visited))
+        return digest.hexdigest()
+  ''', name='bl_camera')
+
+sequence_ids = count()
+
+FRAME_BUFFER_DIRS = [d for d in ['/dev/shm', gettempdir()] if isdir(d)]
+FILL_CHUNK_SIZE = 2**20
+FRAME_BUFFER_SLOTS = 8
+PIXEL_SIZE = 16
+
+frame_buffer = None
+frame_buffer_lock = Lock()
+frame_size = PIXEL_SIZE * 256 * 256
+
+def get_free_space(directory):
+    stats = statvfs(directory)
+    return stats.f_bavail * stats.f_frsize
+
+def fill(descriptor, size):
+    chunk = b'\0' * FILL_CHUNK_SIZE
+    for position in range(0, size, FILL_CHUNK_SIZE):
+        write(descriptor, chunk[:size-position])
+
+def allocate_file(size):
+    for directory in FRAME_BUFFER_DIRS:
+        if get_free_space(directory) < size:
+            continue
+        descriptor, path = mkstemp(prefix='fauxton-', dir=directory)
+        try:
+            fill(descriptor, size)
+            return descriptor, path
+        except OSError:
+            close(descriptor)
+            unlink(path)
+    raise IOError('There isn\'t room for a %d-byte frame buffer in %s.'
+                  % (size, ' or '.join(FRAME_BUFFER_DIRS)))
+
+class FrameBuffer(object):
+    def __init__(self, slot_size, slot_count):
+        descriptor, self.path = allocate_file(slot_size * slot_count)
+        try:
+            self.memory = mmap(descriptor, slot_size * slot_count)
+        finally:
+            close(descriptor)
+        self.slot_size = slot_size
+        self.slots = [None] * slot_count
+        self.unlink = unlink
+
+    def __del__(self):
+        try: self.unlink(self.path)
+        except OSError: pass
+
+    def reserve(self):
+        for i, slot in enumerate(self.slots):
+            if slot is None or isinstance(slot, ref) and slot() is None:
+                self.slots[i] = True
+                return FrameSlot(self, i)
+
+class FrameSlot(object):
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+        self.target = (buffer.path, index * buffer.slot_size, buffer.slot_size)
+
+    def develop(self, result):
+        if isinstance(result, ndarray):
+            self.release()
+            fit_frames(result.shape[-3:-1])
+            return result
+        frame = ndarray(result, 'f', self.buffer.memory, self.target[1])
+        self.buffer.slots[self.index] = ref(frame)
+        return frame
+
+    def release(self):
+        self.buffer.slots[self.index] = None
+
+    def release_if_failed(self, future):
+        try: future.result()
+        except Exception: self.release()
+
+def fit_frames(resolution):
+    global frame_size
+    with frame_buffer_lock:
+        size = PIXEL_SIZE * int(resolution[0]) * int(resolution[1])
+        frame_size = max(frame_size, size)
+
+def reserve_frame(image_count):
+    global frame_buffer
+    with frame_buffer_lock:
+        slot_size = image_count * frame_size
+        if frame_buffer is None:
+            slot_count = FRAME_BUFFER_SLOTS
+        elif frame_buffer.slot_size < slot_size:
+            slot_count = len(frame_buffer.slots)
+        else:
+            slot = frame_buffer.reserve()
+            if slot is not None:
+                return slot
+            slot_count = 2 * len(frame_buffer.slots)
+        frame_buffer = FrameBuffer(slot_size, slot_count)
+        return frame_buffer.reserve()
+
+def release_frame_buffer():
+    global frame_buffer
+    frame_buffer = None
+
+at_exit(release_frame_buffer)
+
+PASS_CHANNELS = {'z': 0, 'normal': slice(0, 3), 'vector': slice(0, 3)}
+
+def develop(camera_type, render_pass_names, slot, result):
+    image = slot.develop(result)
+    if render_pass_names is None:
+        return image[:, :, camera_type.channels]
+    return {name: image[i][:, :, PASS_CHANNELS.get(name, slice(None))]
+            for i, name in enumerate(render_pass_names)}
+
+def get_channel_range(camera_type):
+    if isinstance(camera_type.channels, slice):
+        return list(camera_type.channels.indices(4)[:2])
+    return [camera_type.channels, camera_type.channels + 1]
+
+class DatasetSlot(object):
+    def __init__(self, dataset, index, camera_type, resolution):
+        images = dataset.images
+        channels = get_channel_range(camera_type)
+        channel_count = channels[1] - channels[0]
+        entry_shape = tuple(map(int, resolution)) + (channel_count,)
+        if entry_shape != images.shape[2:]:
+            raise ValueError(
+                'Images of shape %s can\'t be stored in a dataset of images '
+                'of shape %s.' % (entry_shape, images.shape[2:]))
+        frame, camera = index
+        frame_count, camera_count = images.shape[:2]
+        if not (0 <= frame < frame_count and 0 <= camera < camera_count):
+            raise IndexError('%s is not an entry in the dataset.' % (index,))
+        entry_size = images[frame, camera].nbytes
+        offset = images.offset + (frame * camera_count + camera) * entry_size
+        self.dataset = dataset
+        self.index = (frame, camera)
+        self.target = (images.filename, offset, entry_size, channels)
+
+    def develop(self, result):
+        if isinstance(result, ndarray):
+            raise ValueError('The rendered image doesn\'t fit the dataset.')
+        self.dataset.written[self.index] = True
+        return self.dataset.images[self.index]
+
+def render_frame(camera_type, submit, render_pass_names=None):
+    if render_pass_names is not None:
+        render_pass_names = list(render_pass_names)
+    image_count = len(render_pass_names or [None])
+    slot = reserve_frame(image_count)
+    result = submit(slot.target, render_pass_names)
+    result.add_done_callback(slot.release_if_failed)
+    return result.then(partial(develop, camera_type, render_pass_names, slot))
 
 #===============================================================================
 # Public Symbols
@@ -209,70 +826,194 @@ class Camera(Prop):
     :var numpy.ndarray resolution: *y* and *x* resolution, in pixels.
     :var str source: OSL source to use as an emissive material when rendering.
     :var str render_pass: Blender render pass to use (e.g. "z" or "color").
-    :var str render_engine: Blender render engine to use (e.g. "CYCLES").
+    :var str render_engine: Blender render engine to use (e.g. "CYCLES"), or
+        "RAY_CAST" to compute "z" and "normal" passes without rendering.
+    :var render_settings: Render settings to use in place of the scene's: a
+        dictionary with any of the keys "samples", "tile_size", "threads",
+        "light_bounces", and "denoising", or the name of a preset
+        ("annotation" or "production").
     '''
     resource_type = 'CAMERA'
+    channels = slice(None)
 
     def __new__(cls, **properties):
         result = bl_camera.create(cls.resource_type)
-        [setattr(result, k, v) for k, v in properties.items()]
+        set_properties(cls, result, properties)
         return result
 
     @property
     def field_of_view(self):
-        return array(bl_camera.get_field_of_view(self))
+        fetch = lambda: array(bl_camera.get_field_of_view(self))
+        return get_cached(self, 'field_of_view', fetch)
 
     @field_of_view.setter
     def field_of_view(self, field_of_view):
-        bl_camera.set_field_of_view(self, list(map(float, field_of_view)))
+        store = partial(bl_camera.set_field_of_view, self)
+        set_cached(self, 'field_of_view', array(field_of_view, 'd'), store)
 
     @property
     def resolution(self):
-        return array(bl_camera.get_resolution(self))
+        fetch = lambda: array(bl_camera.get_resolution(self))
+        return get_cached(self, 'resolution', fetch)
 
     @resolution.setter
     def resolution(self, resolution):
-        bl_camera.set_resolution(self, list(map(float, resolution)))
+        store = lambda r: bl_camera.set_resolution(self, list(map(float, r)))
+        set_cached(self, 'resolution', array(resolution, 'd'), store)
+        fit_frames(resolution)
 
     @property
     def source(self):
-        return bl_camera.get_source(self)
+        fetch = partial(bl_camera.get_source, self)
+        return get_cached(self, 'source', fetch)
 
     @source.setter
     def source(self, source):
-        bl_camera.set_source(self, source)
+        store = partial(bl_camera.set_source, self)
+        set_cached(self, 'source', source, store)
 
     @property
     def render_pass(self):
-        return bl_camera.get_render_pass(self)
+        fetch = partial(bl_camera.get_render_pass, self)
+        return get_cached(self, 'render_pass', fetch)
 
     @render_pass.setter
     def render_pass(self, render_pass):
-        bl_camera.set_render_pass(self, render_pass)
+        store = partial(bl_camera.set_render_pass, self)
+        set_cached(self, 'render_pass', render_pass, store)
 
     @property
     def render_engine(self):
-        return bl_camera.get_render_engine(self)
+        fetch = partial(bl_camera.get_render_engine, self)
+        return get_cached(self, 'render_engine', fetch)
 
     @render_engine.setter
     def render_engine(self, render_engine):
-        bl_camera.set_render_engine(self, render_engine)
+        store = partial(bl_camera.set_render_engine, self)
+        set_cached(self, 'render_engine', render_engine, store)
+
+    @property
+    def render_settings(self):
+        fetch = partial(bl_camera.get_render_settings, self)
+        return get_cached(self, 'render_settings', fetch)
 
-    def render(self):
+    @render_settings.setter
+    def render_settings(self, render_settings):
+        store = partial(bl_camera.set_render_settings, self)
+        set_cached(self, 'render_settings', render_settings, store)
+
+    def render(self, passes=None, cache=None):
         '''
         Return a snapshot of the camera's containing scene.
 
-        :rtype: numpy.ndarray
+        The snapshot is a view of shared memory that Blender renders into
+        directly. That memory is reused for later snapshots once every array
+        referring to it has been deleted.
+
+        If `passes` is given, every pass it names is rendered at once, and a
+        dictionary mapping each name to an image is returned.
+
+        If `cache` is given, a digest of the scene's state is looked up in it
+        first, and the scene is only rendered if the digest is not found.
+
+        :param list passes: Names of Blender render passes to render (e.g.
+            ``["combined", "z", "normal", "vector"]``), or `None` to render
+            the camera's `render_pass`.
+        :param RenderCache cache: Cache to look snapshots up in and store
+            them in.
+        :rtype: numpy.ndarray or dict
         '''
-        if imread:
-            path = bl_camera.render(self, 'exr')
-            image = imread(path, IMREAD_UNCHANGED)[..., ::-1]
-        else:
-            path = bl_camera.render(self, 'npy')
-            image = load(path)[::-1]
-        rmtree(dirname(path))
+        if cache is None:
+            return self.render_async(passes).result()
+        if passes is not None:
+            passes = list(passes)
+        with accessing_properties():
+            key = bl_camera.get_digest(self, passes)
+        image = cache.get(key)
+        if image is None:
+            image = self.render_async(passes).result()
+            cache.put(key, image)
         return image
 
+    def render_async(self, passes=None):
+        '''
+        Start taking a snapshot of the camera's containing scene.
+
+        The snapshot is rendered while the caller continues, and can be
+        retrieved by calling the result's `result` method.
+
+        :param list passes: Names of Blender render passes to render, as in
+            `render`.
+        :rtype: BlenderFuture
+        '''
+        render = partial(bl_camera.render.submit, self)
+        with accessing_properties():
+            return render_frame(type(self), render, passes)
+
+    def render_into(self, dataset, index):
+        '''
+        Take a snapshot and store it in an entry of a `Dataset`.
+
+        Blender writes the snapshot into the dataset's file directly. The
+        camera's resolution and output channels must match the dataset's
+        image shape.
+
+        :param Dataset dataset: Dataset to store the snapshot in.
+        :param tuple index: Frame and camera indices of the entry.
+        :rtype: numpy.memmap
+        '''
+        slot = DatasetSlot(dataset, index, type(self), self.resolution)
+        with accessing_properties():
+            result = bl_camera.render.submit(self, slot.target)
+        return result.then(slot.develop).result()
+
+    def render_sequence(self, times, passes=None, window=2):
+        '''
+        Take a snapshot at each of a sequence of scene times.
+
+        Snapshots are yielded in order as they finish. Rendering is set up
+        once for the whole sequence, and at most `window` snapshots are
+        rendered ahead of the caller. Other renders of the same scene,
+        including other sequences, undo that setup, and the sequence sets
+        it up again for its next frame. The scene's time is left
+        unspecified afterwards.
+
+        :param times: Iterable of scene times.
+        :param list passes: Names of Blender render passes to render, as in
+            `render`.
+        :param int window: Maximum number of snapshots to render ahead.
+        :rtype: iterator
+        '''
+        if passes is not None:
+            passes = list(passes)
+        sequence_id = next(sequence_ids)
+        def render_at(time, is_last):
+            def render(frame_slot, render_pass_names):
+                with accessing_properties():
+                    return bl_camera.render_sequence_frame.submit(
+                        self, render_pass_names, sequence_id, float(time),
+                        frame_slot, is_last)
+            return render_frame(type(self), render, passes)
+        times = iter(times)
+        time = next(times, None)
+        is_set_up = False
+        try:
+            frames = deque()
+            while time is not None:
+                next_time = next(times, None)
+                frames.append(render_at(time, next_time is None))
+                is_set_up = next_time is not None
+                time = next_time
+                if len(frames) >= window:
+                    yield frames.popleft().result()
+            while len(frames) > 0:
+                yield frames.popleft().result()
+        finally:
+            if is_set_up:
+                try: bl_camera.end_sequence.submit(sequence_id)
+                except BlenderError: pass
+            invalidate_properties(kept_names=POSE_INDEPENDENT_PROPERTIES)
+
     def look_at(self, target, roll=0):
         '''
         Orient the camera towards a point in space.
@@ -312,47 +1053,32 @@ class DepthSensor(Camera):
 
     :param dict \**properties: Initial values of instance variables.
     '''
+    channels = 0
+
     def __new__(cls, **properties):
+        properties.setdefault('render_settings', 'annotation')
         return Camera.__new__(cls, render_pass='z', **properties)
 
-    def render(self):
-        '''
-        Return a snapshot of the camera's containing scene.
-
-        :rtype: numpy.ndarray
-        '''
-        return Camera.render(self)[:, :, 0]
-
 class SurfaceNormalSensor(Camera):
     '''
     A camera that reports the surface normal at each pixel.
 
     :param dict \**properties: Initial values of instance variables.
     '''
+    channels = slice(0, 3)
+
     def __new__(cls, **properties):
+        properties.setdefault('render_settings', 'annotation')
         return Camera.__new__(cls, render_pass='normal', **properties)
 
-    def render(self):
-        '''
-        Return a snapshot of the camera's containing scene.
-
-        :rtype: numpy.ndarray
-        '''
-        return Camera.render(self)[:, :, 0:3]
-
 class VelocitySensor(Camera):
     '''
     A camera that reports the velocity at each pixel.
 
     :param dict \**properties: Initial values of instance variables.
     '''
+    channels = slice(0, 3)
+
     def __new__(cls, **properties):
+        properties.setdefault('render_settings', 'annotation')
         return Camera.__new__(cls, render_pass='vector', **properties)
-
-    def render(self):
-        '''
-        Return a snapshot of the camera's containing scene.
-
-        :rtype: numpy.ndarray
-        '''
-        return Camera.render(self)[:, :, 0:3]
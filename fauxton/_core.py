@@ -1,57 +1,259 @@
 from atexit import register as at_exit
-from os import devnull
-from os.path import exists, join, isfile
+from collections import deque
+from contextlib import contextmanager
+from copy import deepcopy
+from errno import EAGAIN, EWOULDBLOCK
+from hashlib import sha1
+from math import ceil, log
+from os import devnull, environ
+from os.path import join, isfile
 from shutil import rmtree
+from select import select
+from socket import (AF_INET, IPPROTO_TCP, SOCK_STREAM, TCP_NODELAY,
+                    error as socket_error, socket)
+from struct import Struct
 from subprocess import Popen
 from sys import platform
 from tempfile import mkdtemp
-from time import sleep
+from threading import Event, Lock, RLock, local
+from time import time
 from weakref import WeakKeyDictionary, WeakValueDictionary
-from xmlrpclib import ServerProxy
+
+from numpy import (ascontiguousarray, dtype, empty, frombuffer, generic,
+                   ndarray)
+
+from _stand_in import STAND_IN_SOURCE
 
 __name__ = 'fauxton'
-__all__ = ['BlenderModule', 'BlenderError', 'BlenderResource',
-           'enable_blender_gc', 'disable_blender_gc', 'collect_blender_garbage']
+__all__ = ['BlenderModule', 'BlenderFuture', 'BlenderError', 'BlenderResource',
+           'batch', 'enable_blender_gc', 'disable_blender_gc',
+           'collect_blender_garbage', 'get_blender_gc_stats',
+           'enable_property_cache', 'disable_property_cache',
+           'enable_rpc_stats', 'disable_rpc_stats', 'get_rpc_stats',
+           'reset_rpc_stats', 'set_rpc_trace_hook',
+           'get_blender_startup_stats']
 
 #===============================================================================
 # Private Symbols
 #===============================================================================
 
 SERVER_SOURCE = '''
+from collections import deque
 from itertools import count
-from os.path import dirname, join
-from random import randint
-from socket import AF_INET, SOCK_STREAM, socket
+from math import ceil, log
+from os import environ
+from socket import IPPROTO_TCP, TCP_NODELAY, create_connection
+from struct import Struct
 from textwrap import dedent
-from threading import Lock, Thread
-from time import sleep
+from threading import Event, Lock, Thread
+from time import sleep, time
 from traceback import format_exc
-from xmlrpc.server import SimpleXMLRPCServer
+from numpy import (ascontiguousarray, dtype, empty, frombuffer, generic,
+                   ndarray)
 import bpy
 
 #===============================================================================
-# Create an XML-RPC server.
+# Define the wire format.
 #===============================================================================
 
-def is_free(port):
-    return socket(AF_INET, SOCK_STREAM).connect_ex(('localhost', port)) != 0
+SIZE = Struct('<Q')
+INTEGER = Struct('<q')
+FLOAT = Struct('<d')
+
+def encode(value, buffers):
+    head = buffers[-1]
+    if value is None:
+        head += b'N'
+    elif value is True:
+        head += b'T'
+    elif value is False:
+        head += b'F'
+    elif isinstance(value, int) and -2**63 <= value < 2**63:
+        head += b'i' + INTEGER.pack(value)
+    elif isinstance(value, int):
+        encode_bytes(b'I', str(value).encode('ascii'), head)
+    elif isinstance(value, float):
+        head += b'd' + FLOAT.pack(value)
+    elif isinstance(value, str):
+        encode_bytes(b's', value.encode('utf-8'), head)
+    elif isinstance(value, (bytes, bytearray)):
+        encode_bytes(b'b', value, head)
+    elif isinstance(value, ndarray):
+        encode_array(value, buffers)
+    elif isinstance(value, generic):
+        encode(value.item(), buffers)
+    elif isinstance(value, (tuple, list)):
+        head += (b't' if isinstance(value, tuple) else b'l')
+        head += SIZE.pack(len(value))
+        for element in value: encode(element, buffers)
+    elif isinstance(value, dict):
+        head += b'm' + SIZE.pack(len(value))
+        for item in value.items(): encode(item, buffers)
+    elif hasattr(value, 'to_dict'):
+        encode(value.to_dict(), buffers)
+    elif hasattr(value, '__iter__'):
+        encode(list(value), buffers)
+    else:
+        raise TypeError('Cannot transmit %r.' % value)
+
+def encode_bytes(tag, value, head):
+    head += tag + SIZE.pack(len(value)) + value
+
+def encode_array(value, buffers):
+    data = ascontiguousarray(value).reshape(-1).view('u1')
+    type_code = value.dtype.str.encode('ascii')
+    head = buffers[-1]
+    encode_bytes(b'a', type_code, head)
+    head += SIZE.pack(value.ndim)
+    for length in value.shape: head += SIZE.pack(length)
+    head += SIZE.pack(len(data))
+    buffers.extend([data, bytearray()])
 
-def free_port():
-    port = randint(1025, 65535)
-    return port if is_free(port) else free_port()
+def decode(data, offset=0):
+    tag = data[offset:offset+1]
+    offset += 1
+    if tag == b'N':
+        return None, offset
+    elif tag == b'T':
+        return True, offset
+    elif tag == b'F':
+        return False, offset
+    elif tag == b'i':
+        return INTEGER.unpack_from(data, offset)[0], offset + INTEGER.size
+    elif tag == b'I':
+        value, offset = decode_bytes(data, offset)
+        return int(value.decode('ascii')), offset
+    elif tag == b'd':
+        return FLOAT.unpack_from(data, offset)[0], offset + FLOAT.size
+    elif tag == b's':
+        value, offset = decode_bytes(data, offset)
+        return value.decode('utf-8'), offset
+    elif tag == b'b':
+        value, offset = decode_bytes(data, offset)
+        return bytes(value), offset
+    elif tag == b'a':
+        return decode_array(data, offset)
+    elif tag in (b't', b'l'):
+        size, offset = decode_size(data, offset)
+        elements = []
+        for i in range(size):
+            element, offset = decode(data, offset)
+            elements.append(element)
+        return (tuple(elements) if tag == b't' else elements), offset
+    elif tag == b'm':
+        size, offset = decode_size(data, offset)
+        result = {}
+        for i in range(size):
+            (key, value), offset = decode(data, offset)
+            result[key] = value
+        return result, offset
+    else:
+        raise ValueError('Unknown type tag: %r.' % tag)
+
+def decode_size(data, offset):
+    return SIZE.unpack_from(data, offset)[0], offset + SIZE.size
+
+def decode_bytes(data, offset):
+    size, offset = decode_size(data, offset)
+    return data[offset:offset+size], offset + size
 
-def make_server():
+def decode_array(data, offset):
+    type_code, offset = decode_bytes(data, offset)
+    ndim, offset = decode_size(data, offset)
+    shape = []
+    for i in range(ndim):
+        length, offset = decode_size(data, offset)
+        shape.append(length)
+    size, offset = decode_size(data, offset)
+    type_ = dtype(type_code.decode('ascii'))
+    if size == 0:
+        return empty(shape, type_), offset
+    array = frombuffer(data, type_, size // type_.itemsize, offset)
+    return array.reshape(shape), offset + size
+
+def send(connection, value):
+    start_time = time()
     try:
-        port = free_port()
-        server = SimpleXMLRPCServer(('localhost', port), allow_none=True)
-        base = dirname(__file__)
-        with open(join(base, 'port.txt'), 'w+') as f: f.write(str(port))
-        open(join(base, 'lock.txt'), 'w+').close()
-        return server
+        buffers = [bytearray()]
+        encode(value, buffers)
     except:
-        return make_server()
+        buffers = [bytearray()]
+        encode(('fault', format_exc()), buffers)
+    size = sum(len(b) for b in buffers)
+    record_time('encode_time', start_time)
+    connection.sendall(SIZE.pack(size) + buffers[0])
+    for buffer in buffers[1:]:
+        if len(buffer) > 0: connection.sendall(buffer)
+
+def receive(connection):
+    header = receive_exactly(connection, SIZE.size)
+    if header is None:
+        return None
+    return receive_exactly(connection, SIZE.unpack_from(header)[0])
+
+def decode_request(data):
+    start_time = time()
+    request = decode(data)[0]
+    record_time('decode_time', start_time)
+    return request
+
+def receive_exactly(connection, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    position = 0
+    while position < size:
+        n_received = connection.recv_into(view[position:], size - position)
+        if n_received == 0: return None
+        position += n_received
+    return data
+
+#===============================================================================
+# Collect RPC statistics.
+#===============================================================================
+
+rpc_stats = None
+
+def new_rpc_stats():
+    return {'functions': {}, 'lock_wait': 0.0,
+            'decode_time': 0.0, 'encode_time': 0.0}
+
+def record_duration(durations, key, duration):
+    entry = durations.get(key, None)
+    if entry is None:
+        entry = durations[key] = {'count': 0, 'time': 0.0, 'histogram': {}}
+    bucket = 2 ** int(ceil(log(max(1e6 * duration, 1), 2)))
+    entry['count'] += 1
+    entry['time'] += duration
+    entry['histogram'][bucket] = entry['histogram'].get(bucket, 0) + 1
+
+def record_time(field, start_time):
+    if rpc_stats is not None:
+        rpc_stats[field] += time() - start_time
+
+def enable_rpc_stats():
+    global rpc_stats
+    if rpc_stats is None:
+        rpc_stats = new_rpc_stats()
+
+def disable_rpc_stats():
+    global rpc_stats
+    rpc_stats = None
+
+def get_rpc_stats():
+    return rpc_stats
+
+def reset_rpc_stats():
+    global rpc_stats
+    if rpc_stats is not None:
+        rpc_stats = new_rpc_stats()
+
+#===============================================================================
+# Connect to the client.
+#===============================================================================
+
+def connect():
+    return create_connection(('localhost', int(environ['FAUXTON_PORT'])))
 
-server = make_server()
 active = True
 
 #===============================================================================
@@ -59,6 +261,8 @@ active = True
 #===============================================================================
 
 GC_SLEEP_TIME = 0.1
+GC_SWEEP_INTERVAL = 10.0
+GC_TIME_BUDGET = 0.002
 RESOURCE_COLLECTIONS = {
     'Action': bpy.data.actions,
     'Armature': bpy.data.armatures,
@@ -93,7 +297,15 @@ RESOURCE_COLLECTIONS = {
 
 gc_lock = Lock()
 gc_is_enabled = False
-active_resources = set()
+gc_is_dirty = True
+gc_sweep_time = 0.0
+gc_thread = None
+gc_wakeup = Event()
+gc_candidates = deque()
+gc_sweep = deque()
+gc_stats = {'passes': 0, 'full_collections': 0, 'examined': 0,
+            'collected': 0, 'time': 0.0, 'longest_pass': 0.0}
+active_resources = {}
 
 def get_id(resource):
     resource_types = [t.__name__ for t in type(resource).mro()[-4::-1]]
@@ -105,7 +317,7 @@ def get_id(resource):
 
 def reference(resource):
     resource_id = get_id(resource)
-    active_resources.add(resource_id)
+    active_resources[resource_id] = active_resources.get(resource_id, 0) + 1
     return resource_id
 
 def dereference(resource_id):
@@ -113,33 +325,111 @@ def dereference(resource_id):
     base_name = type_name.split(':')[0]
     return RESOURCE_COLLECTIONS[base_name][resource_name]
 
-def release(resource_id):
-    active_resources.remove(resource_id)
+def release(resource_id, reference_count):
+    reference_count = active_resources.get(resource_id, 0) - reference_count
+    if reference_count > 0:
+        active_resources[resource_id] = reference_count
+        return
+    active_resources.pop(resource_id, None)
+    gc_candidates.append((resource_id[0].split(':')[0], resource_id[1]))
+    gc_wakeup.set()
+
+def add_gc_candidate(resource):
+    gc_candidates.append((get_id(resource)[0].split(':')[0], resource.name))
+    gc_wakeup.set()
+
+def get_dependencies(resource):
+    dependencies = []
+    for field in ('data', 'world', 'image', 'texture', 'node_tree'):
+        value = getattr(resource, field, None)
+        if isinstance(value, bpy.types.ID):
+            dependencies.append(value)
+    for material in getattr(resource, 'materials', []):
+        if material is not None:
+            dependencies.append(material)
+    animation_data = getattr(resource, 'animation_data', None)
+    if animation_data is not None and animation_data.action is not None:
+        dependencies.append(animation_data.action)
+    if isinstance(resource, bpy.types.Scene):
+        dependencies.extend(resource.objects)
+    return dependencies
+
+def examine(collection_name, resource_name):
+    gc_stats['examined'] += 1
+    collection = RESOURCE_COLLECTIONS[collection_name]
+    resource = collection.get(resource_name, None)
+    if resource is None or resource.users > 0 or resource.use_fake_user:
+        return False
+    if get_id(resource) in active_resources:
+        return False
+    dependencies = [get_id(d) for d in get_dependencies(resource)]
+    collection.remove(resource)
+    gc_candidates.extend((t.split(':')[0], n) for t, n in dependencies)
+    gc_stats['collected'] += 1
+    return True
+
+def collect_incrementally():
+    global gc_is_dirty, gc_sweep_time
+    with gc_lock:
+        start_time = time()
+        deadline = start_time + GC_TIME_BUDGET
+        is_sweep_due = start_time >= gc_sweep_time + GC_SWEEP_INTERVAL
+        if len(gc_sweep) == 0 and gc_is_dirty and is_sweep_due:
+            gc_sweep.extend((k, None) for k in RESOURCE_COLLECTIONS)
+            gc_is_dirty = False
+            gc_sweep_time = start_time
+        while len(gc_candidates) > 0 and time() < deadline:
+            examine(*gc_candidates.popleft())
+        while len(gc_sweep) > 0 and time() < deadline:
+            collection_name, resource_names = gc_sweep[0]
+            if resource_names is None:
+                collection = RESOURCE_COLLECTIONS[collection_name]
+                gc_sweep[0] = collection_name, list(collection.keys())
+            elif len(resource_names) == 0:
+                gc_sweep.popleft()
+            else:
+                examine(collection_name, resource_names.pop())
+        record_gc_pass(start_time)
+        return len(gc_candidates) > 0
 
 def collect_garbage():
-    def collect_assuming_lock():
-        garbage_collected = False
-        for collection in RESOURCE_COLLECTIONS:
-            for resource in collection:
-                used_internally = resource.users or resource.use_fake_user
-                used_externally = get_id(resource) in active_resources
-                if not (used_internally or used_externally):
-                    collection.remove(resource)
-                    garbage_collected = True
-        if garbage_collected:
-            collect_assuming_lock()
     with gc_lock:
-        collect_assuming_lock()
+        start_time = time()
+        gc_candidates.clear()
+        garbage_collected = True
+        while garbage_collected:
+            garbage_collected = False
+            for collection_name, collection in RESOURCE_COLLECTIONS.items():
+                for resource_name in list(collection.keys()):
+                    if examine(collection_name, resource_name):
+                        garbage_collected = True
+        gc_candidates.clear()
+        gc_stats['full_collections'] += 1
+        record_gc_pass(start_time)
+
+def record_gc_pass(start_time):
+    duration = time() - start_time
+    gc_stats['passes'] += 1
+    gc_stats['time'] += duration
+    gc_stats['longest_pass'] = max(gc_stats['longest_pass'], duration)
+
+def get_gc_stats():
+    return dict(gc_stats, pending=len(gc_candidates))
 
 def enable_gc():
-    global gc_is_enabled
+    global gc_is_enabled, gc_thread
     def collect_continuously():
         while gc_is_enabled:
-            collect_garbage()
-            sleep(GC_SLEEP_TIME)
-    if not gc_is_enabled:
-        gc_is_enabled = True
-        Thread(target=collect_continuously).start()
+            if collect_incrementally():
+                sleep(GC_TIME_BUDGET)
+            else:
+                gc_wakeup.wait(GC_SLEEP_TIME)
+                gc_wakeup.clear()
+    gc_is_enabled = True
+    if gc_thread is None or not gc_thread.is_alive():
+        gc_thread = Thread(target=collect_continuously)
+        gc_thread.daemon = True
+        gc_thread.start()
 
 def disable_gc():
     global gc_is_enabled
@@ -153,43 +443,85 @@ enable_gc()
 
 modules = {}
 
-def new_module_id():
-    id_ = randint(0, 2**30)
-    return id_ if id_ not in modules else new_module_id()
-
-def demarshall(m_argument):
+def demarshall(m_argument, results=()):
     tag, value = m_argument
     if tag == 'value':
         return value
     elif tag == 'reference':
         return dereference(value)
+    elif tag == 'result':
+        return results[value]
 
 def marshall(result):
     if isinstance(result, bpy.types.ID):
         return 'reference', reference(result)
-    else:
-        return 'value', result
+    elif isinstance(result, (list, tuple)):
+        m_results = [marshall(r) for r in result]
+        if any(tag != 'value' for tag, value in m_results):
+            return 'list', m_results
+    return 'value', result
 
-def add_module(source):
-    module_id = new_module_id()
-    modules[module_id] = {'bpy': bpy}
-    exec(dedent(source), modules[module_id])
-    return module_id
+def add_module(module_id, source):
+    if module_id not in modules:
+        namespace = {'bpy': bpy, 'add_gc_candidate': add_gc_candidate}
+        exec(dedent(source), namespace)
+        modules[module_id] = namespace
+
+def add_modules(module_sources):
+    errors = []
+    for module_id, source in module_sources:
+        try: add_module(module_id, source)
+        except: errors.append(format_exc())
+    return errors
 
 def remove_module(module_id):
-    del modules[module_id]
+    modules.pop(module_id, None)
+
+def invoke(module_id, function_name, m_arguments, results=()):
+    module = modules[module_id]
+    function = module[function_name]
+    arguments = [demarshall(a, results) for a in m_arguments]
+    if rpc_stats is None:
+        return function(*arguments)
+    start_time = time()
+    try:
+        return function(*arguments)
+    finally:
+        if rpc_stats is not None:
+            record_duration(rpc_stats['functions'],
+                            (module_id, function_name), time() - start_time)
 
 def call(module_id, function_name, *m_arguments):
+    global gc_is_dirty
+    start_time = time()
     with gc_lock:
+        record_time('lock_wait', start_time)
+        gc_is_dirty = True
         try:
-            module = modules[module_id]
-            function = module[function_name]
-            arguments = list(map(demarshall, m_arguments))
-            result = function(*arguments)
+            result = invoke(module_id, function_name, m_arguments)
             return marshall(result)
         except:
             return 'error', format_exc()
 
+def call_batch(calls):
+    global gc_is_dirty
+    results = []
+    m_results = []
+    start_time = time()
+    with gc_lock:
+        record_time('lock_wait', start_time)
+        gc_is_dirty = True
+        for module_id, function_name, m_arguments in calls:
+            try:
+                result = invoke(module_id, function_name, m_arguments, results)
+                results.append(result)
+                m_results.append(marshall(result))
+            except:
+                m_results.append(('error', format_exc()))
+                break
+    skipped = 'error', 'An earlier call in the same batch failed.'
+    return m_results + [skipped] * (len(calls) - len(m_results))
+
 def shut_down():
     global active
     active = False
@@ -198,65 +530,465 @@ def shut_down():
 # Start the server.
 #===============================================================================
 
-server.register_function(collect_garbage)
-server.register_function(enable_gc)
-server.register_function(disable_gc)
-server.register_function(add_module)
-server.register_function(remove_module)
-server.register_function(call)
-server.register_function(release)
-server.register_function(shut_down)
-
-while active:
-    server.handle_request()
+functions = {f.__name__: f for f in [
+    collect_garbage, get_gc_stats, enable_gc, disable_gc, enable_rpc_stats,
+    disable_rpc_stats, get_rpc_stats, reset_rpc_stats, add_module,
+    add_modules, remove_module, call, call_batch, release, shut_down]}
+
+def serve(connection):
+    connection.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+    while active:
+        data = receive(connection)
+        if data is None:
+            break
+        try:
+            function_name, arguments, released_ids, released_module_ids = (
+                decode_request(data))
+            for resource_id, reference_count in released_ids:
+                release(resource_id, reference_count)
+            for module_id in released_module_ids:
+                remove_module(module_id)
+            response = 'ok', functions[function_name](*arguments)
+        except:
+            response = 'fault', format_exc()
+        send(connection, response)
+    connection.close()
+
+serve(connect())
+disable_gc()
 '''
 
-def start_server():
+SIZE = Struct('<Q')
+INTEGER = Struct('<q')
+FLOAT = Struct('<d')
+
+def encode(value, buffers):
+    head = buffers[-1]
+    if value is None:
+        head += 'N'
+    elif value is True:
+        head += 'T'
+    elif value is False:
+        head += 'F'
+    elif isinstance(value, (int, long)) and -2**63 <= value < 2**63:
+        head += 'i' + INTEGER.pack(value)
+    elif isinstance(value, (int, long)):
+        encode_bytes('I', str(value), head)
+    elif isinstance(value, float):
+        head += 'd' + FLOAT.pack(value)
+    elif isinstance(value, unicode):
+        encode_bytes('s', value.encode('utf-8'), head)
+    elif isinstance(value, str) and is_text(value):
+        encode_bytes('s', value, head)
+    elif isinstance(value, (str, bytearray)):
+        encode_bytes('b', value, head)
+    elif isinstance(value, ndarray):
+        encode_array(value, buffers)
+    elif isinstance(value, generic):
+        encode(value.item(), buffers)
+    elif isinstance(value, (tuple, list)):
+        head += 't' if isinstance(value, tuple) else 'l'
+        head += SIZE.pack(len(value))
+        for element in value: encode(element, buffers)
+    elif isinstance(value, dict):
+        head += 'm' + SIZE.pack(len(value))
+        for item in value.items(): encode(item, buffers)
+    else:
+        raise TypeError('Cannot transmit %r.' % value)
+
+def encode_bytes(tag, value, head):
+    head += tag + SIZE.pack(len(value))
+    head += value
+
+def is_text(value):
+    try: value.decode('utf-8')
+    except UnicodeDecodeError: return False
+    return True
+
+def encode_array(value, buffers):
+    data = ascontiguousarray(value).reshape(-1).view('u1')
+    head = buffers[-1]
+    encode_bytes('a', value.dtype.str, head)
+    head += SIZE.pack(value.ndim)
+    for length in value.shape: head += SIZE.pack(length)
+    head += SIZE.pack(len(data))
+    buffers.extend([data, bytearray()])
+
+def decode(data, offset=0):
+    tag = data[offset]
+    offset += 1
+    if tag == ord('N'):
+        return None, offset
+    elif tag == ord('T'):
+        return True, offset
+    elif tag == ord('F'):
+        return False, offset
+    elif tag == ord('i'):
+        return INTEGER.unpack_from(data, offset)[0], offset + INTEGER.size
+    elif tag == ord('I'):
+        value, offset = decode_bytes(data, offset)
+        return long(str(value)), offset
+    elif tag == ord('d'):
+        return FLOAT.unpack_from(data, offset)[0], offset + FLOAT.size
+    elif tag == ord('s'):
+        value, offset = decode_bytes(data, offset)
+        return decode_text(value), offset
+    elif tag == ord('b'):
+        value, offset = decode_bytes(data, offset)
+        return str(value), offset
+    elif tag == ord('a'):
+        return decode_array(data, offset)
+    elif tag in (ord('t'), ord('l')):
+        size, offset = decode_size(data, offset)
+        elements = []
+        for i in range(size):
+            element, offset = decode(data, offset)
+            elements.append(element)
+        return (tuple(elements) if tag == ord('t') else elements), offset
+    elif tag == ord('m'):
+        size, offset = decode_size(data, offset)
+        result = {}
+        for i in range(size):
+            (key, value), offset = decode(data, offset)
+            result[key] = value
+        return result, offset
+    else:
+        raise ValueError('Unknown type tag: %r.' % chr(tag))
+
+def decode_size(data, offset):
+    return SIZE.unpack_from(data, offset)[0], offset + SIZE.size
+
+def decode_bytes(data, offset):
+    size, offset = decode_size(data, offset)
+    return data[offset:offset+size], offset + size
+
+def decode_text(value):
+    try: return str(value.decode('ascii'))
+    except UnicodeDecodeError: return value.decode('utf-8')
+
+def decode_array(data, offset):
+    type_code, offset = decode_bytes(data, offset)
+    ndim, offset = decode_size(data, offset)
+    shape = []
+    for i in range(ndim):
+        length, offset = decode_size(data, offset)
+        shape.append(length)
+    size, offset = decode_size(data, offset)
+    type_ = dtype(str(type_code))
+    if size == 0:
+        return empty(shape, type_), offset
+    array = frombuffer(data, type_, size // type_.itemsize, offset)
+    return array.reshape(shape), offset + size
+
+def drain(queue):
+    items = []
+    while len(queue) > 0:
+        items.append(queue.popleft())
+    return items
+
+class Connection(object):
+    def __init__(self, socket):
+        self.socket = socket
+        self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        self.socket.setblocking(False)
+        self.send_lock = Lock()
+        self.receive_lock = RLock()
+        self.pending_futures = deque()
+        self.released_ids = deque()
+        self.released_module_ids = deque()
+        self.error = None
+
+    def __getattr__(self, function_name):
+        return lambda *x: self.submit(function_name, *x).result()
+
+    def submit(self, function_name, *arguments):
+        future = BlenderFuture(lambda: self.wait(future))
+        callbacks = []
+        is_tracing = rpc_stats is not None or rpc_trace_hook is not None
+        if is_tracing:
+            start_time = time()
+        with self.send_lock:
+            if self.error is not None:
+                raise self.error
+            released_ids = drain(self.released_ids)
+            released_module_ids = drain(self.released_module_ids)
+            buffers = [bytearray()]
+            encode((function_name, arguments, released_ids,
+                    released_module_ids), buffers)
+            size = sum(len(b) for b in buffers)
+            buffers[0] = SIZE.pack(size) + buffers[0]
+            self.pending_futures.append(future)
+            try:
+                for buffer in buffers:
+                    self.send(buffer, callbacks)
+            except Exception:
+                self.fail()
+                raise self.error
+        if is_tracing:
+            record_size('bytes_sent', SIZE.size + size)
+            future.add_done_callback(
+                record_span('requests', function_name, start_time))
+        for callback in callbacks: callback()
+        return future
+
+    def send(self, data, callbacks):
+        view = memoryview(data)
+        while len(view) > 0:
+            is_receiving = self.receive_lock.acquire(False)
+            try:
+                readers = [self.socket] if is_receiving else []
+                readable, writable = select(readers, [self.socket], [])[:2]
+                if readable:
+                    callbacks.append(self.receive_response())
+            finally:
+                if is_receiving: self.receive_lock.release()
+            if writable:
+                try: view = view[self.socket.send(view):]
+                except socket_error as e:
+                    if e.errno not in (EAGAIN, EWOULDBLOCK): raise
+
+    def wait(self, future):
+        while not future.done():
+            with self.receive_lock:
+                if future.done():
+                    break
+                try:
+                    run_callbacks = self.receive_response()
+                except Exception:
+                    self.fail()
+                    raise self.error
+            run_callbacks()
+
+    def receive_response(self):
+        header = self.receive(SIZE.size)
+        size = decode_size(header, 0)[0]
+        status, value = decode(self.receive(size))[0]
+        if rpc_stats is not None:
+            record_size('bytes_received', SIZE.size + size)
+        future = self.pending_futures.popleft()
+        if status == 'fault':
+            return future._settle(None, BlenderError(value))
+        else:
+            return future._settle(value, None)
+
+    def receive(self, size):
+        data = bytearray(size)
+        view = memoryview(data)
+        position = 0
+        while position < size:
+            try:
+                n_received = self.socket.recv_into(view[position:])
+            except socket_error as e:
+                if e.errno not in (EAGAIN, EWOULDBLOCK): raise
+                select([self.socket], [], [])
+                continue
+            if n_received == 0: raise IOError('The Blender server hung up.')
+            position += n_received
+        return data
+
+    def fail(self):
+        self.error = BlenderError('Lost the connection to Blender.')
+        while len(self.pending_futures) > 0:
+            self.pending_futures.popleft().set_exception(self.error)
+
+    def release(self, resource_id, reference_count=1):
+        self.released_ids.append((resource_id, reference_count))
+
+    def release_module(self, module_id):
+        self.released_module_ids.append(module_id)
+
+rpc_lock = Lock()
+rpc_stats = None
+rpc_trace_hook = None
+module_names = {}
+
+def new_rpc_stats():
+    return {'requests': {}, 'functions': {},
+            'bytes_sent': 0, 'bytes_received': 0}
+
+def record_duration(durations, key, duration):
+    entry = durations.get(key, None)
+    if entry is None:
+        entry = durations[key] = {'count': 0, 'time': 0.0, 'histogram': {}}
+    bucket = 2 ** int(ceil(log(max(1e6 * duration, 1), 2)))
+    entry['count'] += 1
+    entry['time'] += duration
+    entry['histogram'][bucket] = entry['histogram'].get(bucket, 0) + 1
+
+def record_size(field, size):
+    with rpc_lock:
+        if rpc_stats is not None:
+            rpc_stats[field] += size
+
+def record_span(category, name, start_time):
+    def finish(future):
+        end_time = time()
+        with rpc_lock:
+            if rpc_stats is not None:
+                record_duration(rpc_stats[category], name,
+                                end_time - start_time)
+        trace_hook = rpc_trace_hook
+        if trace_hook is not None:
+            trace_hook(category, name, start_time, end_time)
+    return finish
+
+def get_function_name(module_id, symbol):
+    return '%s.%s' % (module_names.get(module_id, module_id), symbol)
+
+def launch_blender(base):
     blender_paths = ['/Applications/blender.app/Contents/MacOS/blender',
                      '/Applications/Blender.app/Contents/MacOS/blender']
-    base = mkdtemp()
-    with open(join(base, 'server.py'), 'w+') as f: f.write(SERVER_SOURCE)
-    blender_path = next(iter(filter(isfile, blender_paths)), 'blender')
-    command = [blender_path, '-b', '-P', join(base, 'server.py')]
-    Popen(command, stdout=open(devnull, 'w'), stderr=open(devnull, 'w'))
-    while not exists(join(base, 'lock.txt')): sleep(.001)
-    with open(join(base, 'port.txt')) as f: port = f.read()
-    rmtree(base)
-    return ServerProxy("http://localhost:%s/" % port, allow_none=True)
-
-server = start_server()
-at_exit(server.shut_down)
+    blender_path = environ.get('FAUXTON_BLENDER', None) or next(
+        iter(filter(isfile, blender_paths)), 'blender')
+    return [blender_path, '-b', '-P', join(base, 'server.py')]
+
+def launch_stand_in(base):
+    with open(join(base, 'bpy.py'), 'w+') as f: f.write(STAND_IN_SOURCE)
+    python_path = environ.get('FAUXTON_PYTHON', None) or 'python3'
+    return [python_path, join(base, 'server.py')]
+
+backends = {'blender': launch_blender, 'stand_in': launch_stand_in}
+
+def start_servers(count):
+    backend = environ.get('FAUXTON_BACKEND', None) or 'blender'
+    if backend not in backends:
+        raise ValueError('"%s" is not a Fauxton backend (expected one of %s).'
+                         % (backend, ', '.join(sorted(backends))))
+    listener = socket(AF_INET, SOCK_STREAM)
+    listener.bind(('localhost', 0))
+    listener.listen(count)
+    environment = dict(environ, FAUXTON_PORT=str(listener.getsockname()[1]))
+    bases = [mkdtemp() for i in range(count)]
+    processes = []
+    for base in bases:
+        with open(join(base, 'server.py'), 'w+') as f: f.write(SERVER_SOURCE)
+        command = backends[backend](base)
+        processes.append(Popen(command, env=environment,
+                               stdout=open(devnull, 'w'),
+                               stderr=open(devnull, 'w')))
+    sockets = []
+    try:
+        while len(sockets) < count:
+            if select([listener], [], [], 0.1)[0]:
+                sockets.append(listener.accept()[0])
+            elif any(p.poll() is not None for p in processes):
+                raise BlenderError('A Blender server exited during startup.')
+    finally:
+        listener.close()
+        for base in bases: rmtree(base)
+    return [Connection(s) for s in sockets]
+
+def start_server():
+    return start_servers(1)[0]
+
+server = None
+server_lock = RLock()
+startup_stats = None
+pending_modules = []
+
+def shut_down(connection):
+    try: connection.shut_down()
+    except (BlenderError, IOError): pass
+
+def get_server():
+    global server, startup_stats
+    if server is not None:
+        return server
+    with server_lock:
+        if server is None:
+            start_time = time()
+            connection = start_server()
+            connect_time = time()
+            errors = connection.add_modules(pending_modules)
+            end_time = time()
+            at_exit(shut_down, connection)
+            startup_stats = {
+                'connect_time': connect_time - start_time,
+                'registration_time': end_time - connect_time,
+                'total_time': end_time - start_time,
+                'modules': len(pending_modules)}
+            del pending_modules[:]
+            server = connection
+            if len(errors) > 0:
+                raise BlenderError(errors[0])
+    return server
+
+module_counts = {}
+module_lock = RLock()
+
+def get_module_id(source):
+    if isinstance(source, unicode):
+        source = source.encode('utf-8')
+    return sha1(source).hexdigest()
+
+def acquire_module(module_id, source):
+    with module_lock:
+        module_counts[module_id] = module_counts.get(module_id, 0) + 1
+        if module_counts[module_id] > 1:
+            return
+        with server_lock:
+            is_pending = server is None
+            if is_pending:
+                pending_modules.append((module_id, source))
+        if not is_pending:
+            try:
+                server.add_module(module_id, source)
+            except:
+                del module_counts[module_id]
+                raise
+
+def release_module(module_id):
+    with module_lock:
+        module_counts[module_id] -= 1
+        if module_counts[module_id] > 0:
+            return
+        del module_counts[module_id]
+        with server_lock:
+            if server is None:
+                pending_modules[:] = [
+                    m for m in pending_modules if m[0] != module_id]
+            else:
+                server.release_module(module_id)
 
 class Monitor(object):
-    def __init__(self, destructor):
-        self.destructor = destructor
+    def __init__(self, resource_id):
+        self.resource_id = resource_id
+        self.reference_count = 1
 
     def __del__(self):
-        try: self.destructor()
+        try: get_server().release(self.resource_id, self.reference_count)
         except: pass
 
 resource_types = {}
 resources = WeakValueDictionary()
 resource_ids = WeakKeyDictionary()
 resource_monitors = WeakKeyDictionary()
+resource_lock = RLock()
 
 def reference(resource):
     return resource_ids[resource]
 
 def dereference(resource_id):
-    if resource_id in resources:
-        return resources[resource_id]
-    type_names = resource_id[0].split(':')[::-1] + ['ID']
-    best_type_name = next(n for n in type_names if n in resource_types)
-    resource = object.__new__(resource_types[best_type_name])
-    monitor = Monitor(lambda: server.release(resource_id))
-    resources[resource_id] = resource
-    resource_ids[resource] = resource_id
-    resource_monitors[resource] = monitor
-    return resource
+    with resource_lock:
+        resource = resources.get(resource_id, None)
+        if resource is not None:
+            resource_monitors[resource].reference_count += 1
+            return resource
+        type_names = resource_id[0].split(':')[::-1] + ['ID']
+        best_type_name = next(n for n in type_names if n in resource_types)
+        resource = object.__new__(resource_types[best_type_name])
+        monitor = Monitor(resource_id)
+        resources[resource_id] = resource
+        resource_ids[resource] = resource_id
+        resource_monitors[resource] = monitor
+        return resource
 
 def marshall(argument):
-    if argument in resource_ids:
+    if isinstance(argument, BlenderFuture):
+        return marshall(argument.result())
+    elif isinstance(argument, BlenderResource) and argument in resource_ids:
+        if getattr(property_state, 'accessor_depth', 0) == 0:
+            invalidate_properties(argument)
         return 'reference', reference(argument)
     else:
         return 'value', argument
@@ -267,13 +999,152 @@ def demarshall(m_result):
         return value
     elif tag == 'reference':
         return dereference(tuple(value))
+    elif tag == 'list':
+        return [demarshall(m) for m in value]
     elif tag == 'error':
         raise BlenderError(value)
 
 def call(module_id, symbol, *arguments):
-    m_arguments = map(marshall, arguments)
-    m_result = server.call(module_id, symbol, *m_arguments)
-    return demarshall(m_result)
+    if current_batch() is not None:
+        return call_async(module_id, symbol, *arguments)
+    else:
+        return call_async(module_id, symbol, *arguments).result()
+
+def call_async(module_id, symbol, *arguments):
+    is_tracing = rpc_stats is not None or rpc_trace_hook is not None
+    if is_tracing:
+        start_time = time()
+    if current_batch() is not None:
+        future = current_batch().submit(module_id, symbol, arguments)
+    else:
+        m_arguments = map(marshall, arguments)
+        m_result = get_server().submit('call', module_id, symbol,
+                                       *m_arguments)
+        future = m_result.then(demarshall)
+    if is_tracing:
+        name = get_function_name(module_id, symbol)
+        future.add_done_callback(record_span('functions', name, start_time))
+    return future
+
+class RemoteFunction(object):
+    def __init__(self, module, symbol):
+        self.module = module
+        self.module_id = module._id
+        self.symbol = symbol
+
+    def __call__(self, *arguments):
+        return call(self.module_id, self.symbol, *arguments)
+
+    def submit(self, *arguments):
+        return call_async(self.module_id, self.symbol, *arguments)
+
+class Batch(object):
+    def __init__(self):
+        self.calls = []
+        self.futures = []
+        self.indices = {}
+        self.errors = []
+
+    def submit(self, module_id, symbol, arguments):
+        m_arguments = map(self.marshall, arguments)
+        future = BlenderFuture(self.flush)
+        self.indices[future] = len(self.calls)
+        self.calls.append((module_id, symbol, m_arguments))
+        self.futures.append(future)
+        return future
+
+    def marshall(self, argument):
+        if isinstance(argument, BlenderFuture) and argument in self.indices:
+            return 'result', self.indices[argument]
+        else:
+            return marshall(argument)
+
+    def flush(self):
+        calls, futures = self.calls, self.futures
+        self.calls, self.futures, self.indices = [], [], {}
+        if len(calls) > 0:
+            try:
+                m_results = get_server().call_batch(calls)
+            except BlenderError as error:
+                m_results = [('error', str(error))] * len(calls)
+            for future, m_result in zip(futures, m_results):
+                try:
+                    future.set_result(demarshall(m_result))
+                except BlenderError as error:
+                    future.set_exception(error)
+                    self.errors.append(error)
+
+batch_state = local()
+
+def current_batch():
+    return getattr(batch_state, 'batch', None)
+
+property_cache = WeakKeyDictionary()
+property_state = local()
+is_caching_properties = False
+
+def invalidate_properties(resource=None, kept_names=()):
+    with resource_lock:
+        if len(kept_names) > 0:
+            caches = (property_cache.values() if resource is None
+                      else [property_cache.get(resource, {})])
+            for values in caches:
+                for name in list(values):
+                    if name not in kept_names: del values[name]
+        elif resource is None:
+            property_cache.clear()
+        else:
+            property_cache.pop(resource, None)
+
+@contextmanager
+def accessing_properties():
+    depth = getattr(property_state, 'accessor_depth', 0)
+    property_state.accessor_depth = depth + 1
+    try: yield
+    finally: property_state.accessor_depth = depth
+
+def can_cache_properties(resource, always=False):
+    return ((always or is_caching_properties) and current_batch() is None
+            and not isinstance(resource, BlenderFuture))
+
+def copy_value(value):
+    return value.copy() if isinstance(value, (dict, ndarray)) else value
+
+def get_cached(resource, name, fetch, always=False):
+    if not can_cache_properties(resource, always):
+        return fetch()
+    with resource_lock:
+        values = property_cache.get(resource, {})
+        if name in values:
+            return copy_value(values[name])
+    with accessing_properties():
+        value = fetch()
+    with resource_lock:
+        property_cache.setdefault(resource, {})[name] = value
+    return copy_value(value)
+
+def set_cached(resource, name, value, store):
+    if not can_cache_properties(resource):
+        return store(value)
+    with accessing_properties():
+        store(value)
+    with resource_lock:
+        property_cache.setdefault(resource, {})[name] = copy_value(value)
+
+def update_cached(resource, name, update):
+    with resource_lock:
+        values = property_cache.get(resource, {})
+        if name in values and can_cache_properties(resource, True):
+            update(values[name])
+        elif name in values:
+            del values[name]
+
+def set_properties(type_, resource, properties):
+    for name, value in properties.items():
+        if isinstance(resource, BlenderFuture):
+            getattr(type_, name).__set__(resource, value)
+        else:
+            setattr(resource, name, value)
 
 #===============================================================================
 # Public Symbols
@@ -284,23 +1155,122 @@ class BlenderModule(object):
     Custom Blender functionality accessible via remote procedure calling.
 
     :param str source: Python code to be executed.
+    :param str name: Name to identify the module by in `get_rpc_stats`.
+
+    Modules are identified by their source code: instances created from the
+    same source share one namespace on the server, which is executed when
+    the first of them is created and discarded when the last is destroyed.
 
     Operations defined on a `BlenderModule` `m`:
-        =============== ========================================================
-        `getattr(m, s)` Access the callable symbol `s` defined within `m`.
-        =============== ========================================================
+        ======================== ===============================================
+        `getattr(m, s)`          Access the callable symbol `s` defined within
+                                 `m`.
+        `getattr(m, s).submit()` Call `s` without waiting for it to complete,
+                                 returning a `BlenderFuture`.
+        ======================== ===============================================
     '''
-    def __init__(self, source=''):
-        self._id = server.add_module(source)
+    def __init__(self, source='', name=None):
+        self._source = source
+        self._id = None
+        module_id = get_module_id(source)
+        acquire_module(module_id, source)
+        self._id = module_id
+        if name is not None:
+            module_names[module_id] = name
 
     def __del__(self):
-        try: server.remove_module(self)
-        except: pass
+        try:
+            if self._id is not None:
+                release_module(self._id)
+        except:
+            pass
 
     def __getattr__(self, symbol):
         '''
         '''
-        return lambda *x: call(self._id, symbol, *x)
+        return RemoteFunction(self, symbol)
+
+class BlenderFuture(object):
+    '''
+    The eventual result of a call to a `BlenderModule` function.
+
+    A `BlenderFuture` is returned by `getattr(m, s).submit(...)`, and in
+    place of a result when a call is made within a `batch` context. It can
+    be passed as an argument to other calls, including as a stand-in for a
+    `BlenderResource`.
+    '''
+    def __init__(self, flush=None):
+        self._flush = flush
+        self._event = Event()
+        self._lock = Lock()
+        self._callbacks = []
+        self._value = None
+        self._exception = None
+
+    def done(self):
+        '''
+        Return whether the call has completed.
+
+        :rtype: bool
+        '''
+        return self._event.is_set()
+
+    def result(self):
+        '''
+        Wait for the call to complete, then return its result.
+
+        If the call raised an exception, it is re-raised. Within a `batch`
+        context, this sends every pending call in the batch to Blender.
+        '''
+        if not self._event.is_set() and self._flush is not None:
+            self._flush()
+        self._event.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+    def add_done_callback(self, callback):
+        '''
+        Arrange for a function to be called with this future once it is done.
+
+        The function is called by whichever thread receives the result, so it
+        should return quickly.
+
+        :param callable callback: Function to call.
+        '''
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def then(self, function):
+        '''
+        Return a future for the result of applying a function to this one's.
+
+        :param callable function: Function to apply.
+        :rtype: BlenderFuture
+        '''
+        future = BlenderFuture(self.result)
+        def resolve(source):
+            try: future.set_result(function(source.result()))
+            except Exception as exception: future.set_exception(exception)
+        self.add_done_callback(resolve)
+        return future
+
+    def set_result(self, value):
+        self._settle(value, None)()
+
+    def set_exception(self, exception):
+        self._settle(None, exception)()
+
+    def _settle(self, value, exception):
+        with self._lock:
+            self._value = value
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        return lambda: [callback(self) for callback in callbacks]
 
 class BlenderError(Exception):
     '''
@@ -325,20 +1295,183 @@ class BlenderResource(object):
             resource_types[result.resource_type] = result
             return result
 
+@contextmanager
+def batch():
+    '''
+    Send the `BlenderModule` calls made in this context as a single request.
+
+    Within the context, calls return instances of `BlenderFuture` instead of
+    results. Every pending call is sent to Blender when the context exits or
+    when the result of any of them is requested, whichever comes first.
+    Calls are executed in the order they were made; if one fails, the
+    calls after it are skipped and the first error is raised when the
+    context exits. Nested `batch` contexts join the outermost one.
+    '''
+    if current_batch() is not None:
+        yield
+    else:
+        batch_state.batch = Batch()
+        try:
+            yield
+        finally:
+            pending_batch, batch_state.batch = batch_state.batch, None
+            pending_batch.flush()
+        if len(pending_batch.errors) > 0:
+            raise pending_batch.errors[0]
+
 def enable_blender_gc():
     '''
     Allow the Blender server to automatically free unused resources.
     '''
-    server.enable_gc()
+    get_server().enable_gc()
 
 def disable_blender_gc():
     '''
     Prevent the Blender server from automatically freeing unused resources.
     '''
-    server.disable_gc()
+    get_server().disable_gc()
 
 def collect_blender_garbage():
     '''
     Manually free unused Blender resources.
+
+    Unlike automatic garbage collection, which examines a bounded number of
+    resources at a time, this examines every resource on the server.
+    '''
+    get_server().collect_garbage()
+
+def get_blender_gc_stats():
+    '''
+    Return statistics describing the Blender server's garbage collector.
+
+    The result maps "passes", "full_collections", "examined", "collected",
+    "time", "longest_pass", and "pending" to the number of collection passes
+    run, the number of those that examined every resource, the number of
+    resources examined and freed, the total and maximum time spent in a
+    pass (in seconds), and the number of resources waiting to be examined.
+
+    :rtype: dict
+    '''
+    return get_server().get_gc_stats()
+
+def get_blender_startup_stats():
+    '''
+    Return statistics describing how the Blender server was started.
+
+    The server is started the first time it's needed, rather than when
+    Fauxton is imported. Once it has started, the result maps
+    "connect_time", "registration_time", and "total_time" to the time spent
+    launching Blender and waiting for it to connect, registering the
+    `BlenderModule` instances created before then, and both (in seconds),
+    and "modules" to the number of modules registered. Before then, the
+    result is `None`.
+
+    :rtype: dict
+    '''
+    with server_lock:
+        return None if startup_stats is None else dict(startup_stats)
+
+def enable_property_cache():
+    '''
+    Start remembering the values of `BlenderResource` properties.
+
+    While enabled, reading a property such as `Prop.position` or
+    `Camera.resolution` returns the last value read or written, rather than
+    querying Blender. A resource's remembered values are forgotten whenever
+    it is passed to a `BlenderModule` function, and every remembered value
+    is forgotten when a `Scene`'s time changes. Changes made by Blender code
+    that does not receive the resource as an argument are not detected;
+    call `disable_property_cache` before making them.
+    '''
+    global is_caching_properties
+    is_caching_properties = True
+
+def disable_property_cache():
+    '''
+    Stop remembering the values of `BlenderResource` properties, and forget
+    any values already remembered.
+    '''
+    global is_caching_properties
+    is_caching_properties = False
+    invalidate_properties()
+
+def enable_rpc_stats():
+    '''
+    Start recording statistics describing calls to the Blender server.
+    '''
+    global rpc_stats
+    with rpc_lock:
+        if rpc_stats is None:
+            rpc_stats = new_rpc_stats()
+    get_server().enable_rpc_stats()
+
+def disable_rpc_stats():
+    '''
+    Stop recording statistics describing calls to the Blender server, and
+    discard those recorded so far.
+    '''
+    global rpc_stats
+    with rpc_lock:
+        rpc_stats = None
+    get_server().disable_rpc_stats()
+
+def reset_rpc_stats():
+    '''
+    Discard the statistics recorded so far, without stopping recording.
+    '''
+    global rpc_stats
+    with rpc_lock:
+        if rpc_stats is not None:
+            rpc_stats = new_rpc_stats()
+    get_server().reset_rpc_stats()
+
+def get_rpc_stats():
+    '''
+    Return statistics describing calls to the Blender server.
+
+    Statistics are only recorded between calls to `enable_rpc_stats` and
+    `disable_rpc_stats`. The result maps:
+
+    - "functions" to the client-side latency of each `BlenderModule`
+      function called, keyed by "module_name.function_name".
+    - "server_functions" to the time Blender spent executing each function.
+    - "requests" to the round-trip latency of each kind of request sent
+      to the server (e.g. "call" or "call_batch").
+    - "bytes_sent" and "bytes_received" to the total size of the requests
+      and responses.
+    - "lock_wait", "decode_time", and "encode_time" to the time the server
+      spent waiting for its garbage collector to release Blender, decoding
+      requests, and encoding responses (in seconds).
+
+    Latencies are dictionaries mapping "count" and "time" to the number and
+    total duration (in seconds) of calls, and "histogram" to a dictionary
+    mapping powers of 2 to the number of calls that took at most that many
+    microseconds (and more than half as many).
+
+    :rtype: dict
+    '''
+    with rpc_lock:
+        stats = deepcopy(rpc_stats or new_rpc_stats())
+    server_stats = get_server().get_rpc_stats() or {
+        'functions': {}, 'lock_wait': 0.0,
+        'decode_time': 0.0, 'encode_time': 0.0}
+    stats['server_functions'] = {
+        get_function_name(*key): value
+        for key, value in server_stats.pop('functions').items()}
+    stats.update(server_stats)
+    return stats
+
+def set_rpc_trace_hook(hook):
+    '''
+    Set a function to call each time a call to the Blender server completes.
+
+    The function is called as `hook(category, name, start_time, end_time)`,
+    where `category` is "functions" or "requests", `name` is as in
+    `get_rpc_stats`, and the times are as returned by `time.time`. It is
+    called by whichever thread receives the result, so it should return
+    quickly.
+
+    :param callable hook: Function to call, or `None` to stop tracing.
     '''
-    server.collect_garbage()
+    global rpc_trace_hook
+    rpc_trace_hook = hook
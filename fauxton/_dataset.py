@@ -0,0 +1,122 @@
+from collections import deque
+from os import makedirs
+from os.path import exists, join
+
+from numpy import argwhere, float32
+from numpy.lib.format import open_memmap
+
+from _core import accessing_properties, invalidate_properties
+from _scene import POSE_INDEPENDENT_PROPERTIES, bl_scene
+from _camera import DatasetSlot, bl_camera, get_channel_range
+
+__name__ = 'fauxton'
+__all__ = ['Dataset', 'render_dataset']
+
+#===============================================================================
+# Public Symbols
+#===============================================================================
+
+class Dataset(object):
+    '''
+    A set of rendered images stored on disk, indexed by frame and camera.
+
+    Images are stored in "images.npy", in the directory `path`, as an array
+    of 32-bit floats with shape `(frame_count, camera_count, height, width,
+    channel_count)`, which Blender renders into directly. The entries that
+    have been rendered are recorded in "written.npy", so a partially
+    rendered dataset can be opened again and finished.
+
+    :param str path: Directory to store the dataset in.
+    :param tuple shape: Shape of the image array. It is required to create
+        a dataset, and checked against the stored one to open a dataset.
+
+    :var numpy.memmap images: The image array.
+    :var numpy.memmap written: A boolean array with shape `(frame_count,
+        camera_count)` marking the entries that have been rendered.
+    '''
+    def __init__(self, path, shape=None):
+        images_path = join(path, 'images.npy')
+        written_path = join(path, 'written.npy')
+        if exists(images_path):
+            self.images = open_memmap(images_path, 'r+')
+            self.written = open_memmap(written_path, 'r+')
+            if shape is not None and tuple(shape) != self.images.shape:
+                raise ValueError(
+                    'The dataset at "%s" has shape %s, not %s.'
+                    % (path, self.images.shape, tuple(shape)))
+        elif shape is None:
+            raise ValueError('There is no dataset at "%s".' % path)
+        else:
+            if not exists(path):
+                makedirs(path)
+            shape = tuple(map(int, shape))
+            self.written = open_memmap(written_path, 'w+', bool, shape[:2])
+            self.images = open_memmap(images_path, 'w+', float32, shape)
+
+    def __len__(self):
+        return len(self.images)
+
+    def missing(self):
+        '''
+        Return the indices of the entries that haven't been rendered.
+
+        :rtype: list
+        '''
+        return [tuple(map(int, i)) for i in argwhere(~self.written)]
+
+    def flush(self):
+        '''
+        Write any changes to the dataset's files.
+        '''
+        self.images.flush()
+        self.written.flush()
+
+def render_dataset(scene, cameras, times, path, window=2):
+    '''
+    Take snapshots with several cameras at each of a sequence of scene
+    times, and store them in a `Dataset`.
+
+    Entry `(i, j)` of the dataset holds the snapshot taken by `cameras[j]`
+    at `times[i]`. If the dataset already exists, the entries already
+    rendered are skipped, so an interrupted call can be resumed by making
+    it again. At most `window` frames are rendered ahead of the caller. The
+    scene's time is left unspecified afterwards.
+
+    :param Scene scene: Scene containing the cameras.
+    :param list cameras: Cameras with the same resolution and output
+        channels.
+    :param list times: Scene times.
+    :param str path: Directory to store the dataset in.
+    :param int window: Maximum number of frames to render ahead.
+    :rtype: Dataset
+    '''
+    cameras = list(cameras)
+    times = list(times)
+    camera_types = [type(c) for c in cameras]
+    resolutions = [c.resolution for c in cameras]
+    channels = get_channel_range(camera_types[0])
+    shape = ((len(times), len(cameras)) + tuple(map(int, resolutions[0]))
+             + (channels[1] - channels[0],))
+    dataset = Dataset(path, shape)
+    renders = deque()
+    for i, time in enumerate(times):
+        indices = [(i, j) for j in range(len(cameras))
+                   if not dataset.written[i, j]]
+        if len(indices) == 0:
+            continue
+        with accessing_properties():
+            set_time = bl_scene.set_time.submit(scene, float(time))
+        renders.append(set_time)
+        for index in indices:
+            j = index[1]
+            slot = DatasetSlot(dataset, index, camera_types[j], resolutions[j])
+            with accessing_properties():
+                render = bl_camera.render.submit(cameras[j], slot.target)
+            renders.append(render.then(slot.develop))
+        while len(renders) > window * (len(cameras) + 1):
+            renders.popleft().result()
+    while len(renders) > 0:
+        renders.popleft().result()
+    invalidate_properties(kept_names=POSE_INDEPENDENT_PROPERTIES)
+    dataset.flush()
+    return dataset
@@ -0,0 +1,158 @@
+from collections import deque
+from functools import partial
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from weakref import WeakKeyDictionary
+
+from _core import BlenderError, start_servers
+from _scene import bl_scene, write_scene
+from _camera import bl_camera, render_frame
+
+__name__ = 'fauxton'
+__all__ = ['BlenderPool']
+
+#===============================================================================
+# Private Symbols
+#===============================================================================
+
+def unwrap(m_results):
+    for tag, value in m_results:
+        if tag == 'error':
+            raise BlenderError(value)
+    return m_results[-1][1]
+
+class Worker(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.scene_module_id = bl_scene._id
+        self.camera_module_id = bl_camera._id
+        errors = connection.add_modules([(bl_scene._id, bl_scene._source),
+                                         (bl_camera._id, bl_camera._source)])
+        if len(errors) > 0:
+            raise BlenderError(errors[0])
+        self.scene_id = None
+
+    def load(self, path):
+        if self.scene_id is not None:
+            self.connection.release(self.scene_id)
+        calls = [(self.scene_module_id, 'load', [('value', path)])]
+        return self.connection.submit('call_batch', calls).then(self.set_scene)
+
+    def set_scene(self, m_results):
+        self.scene_id = tuple(unwrap(m_results))
+
+    def render(self, name, time, frame_slot, render_pass_names):
+        scene = 'reference', self.scene_id
+        calls = [(self.scene_module_id, 'set_time',
+                  [scene, ('value', time)]),
+                 (self.scene_module_id, 'get_by_name',
+                  [scene, ('value', name)]),
+                 (self.camera_module_id, 'render',
+                  [('result', 1), ('value', frame_slot),
+                   ('value', render_pass_names)])]
+        return self.connection.submit('call_batch', calls).then(
+            self.finish_render)
+
+    def finish_render(self, m_results):
+        if len(m_results) > 1 and m_results[1][0] == 'reference':
+            self.connection.release(tuple(m_results[1][1]))
+        return unwrap(m_results)
+
+    def load_factor(self):
+        return len(self.connection.pending_futures)
+
+#===============================================================================
+# Public Symbols
+#===============================================================================
+
+class BlenderPool(object):
+    '''
+    A group of Blender servers that render copies of a scene in parallel.
+
+    :param int size: Number of Blender servers to start.
+
+    A scene is copied to every server with `load`. Each render request is
+    then sent to the least busy server.
+    '''
+    def __init__(self, size):
+        self._workers = [Worker(c) for c in start_servers(size)]
+        self._scene = None
+        self._time = None
+        self._camera_names = WeakKeyDictionary()
+        self._camera_types = {}
+
+    def load(self, scene):
+        '''
+        Copy a scene to every server in the pool.
+
+        Later changes to `scene` are not reflected in the pool until it is
+        loaded again.
+
+        :param Scene scene: Scene to copy.
+        '''
+        base = mkdtemp()
+        try:
+            write_scene(join(base, 'scene.blend'), scene)
+            loads = [w.load(join(base, 'scene.blend')) for w in self._workers]
+            [f.result() for f in loads]
+        finally:
+            rmtree(base)
+        self._scene = scene
+        self._time = scene.time
+        self._camera_names = WeakKeyDictionary()
+        self._camera_types = {}
+
+    def render(self, camera, time=None, passes=None):
+        '''
+        Start taking a snapshot with one of the loaded scene's cameras.
+
+        :param camera: A `Camera` in the loaded scene, or its name.
+        :param float time: Scene time to render at, or `None` to use the
+            scene's time when it was loaded.
+        :param list passes: Names of Blender render passes to render at once,
+            as in `Camera.render`.
+        :rtype: BlenderFuture
+        '''
+        if self._scene is None:
+            raise BlenderError('No scene has been loaded into the pool.')
+        if isinstance(camera, basestring):
+            name = camera
+        elif camera in self._camera_names:
+            name = self._camera_names[camera]
+        else:
+            name = bl_scene.get_name(self._scene, camera)
+            self._camera_names[camera] = name
+        if name not in self._camera_types:
+            self._camera_types[name] = type(self._scene[name])
+        worker = min(self._workers, key=Worker.load_factor)
+        time = float(self._time if time is None else time)
+        render = partial(worker.render, name, time)
+        return render_frame(self._camera_types[name], render, passes)
+
+    def render_all(self, requests):
+        '''
+        Render a sequence of snapshots in parallel.
+
+        Snapshots are yielded in the order they were requested. A bounded
+        number of renders is kept in flight, so `requests` may be long (or
+        infinite).
+
+        :param requests: Iterable of `(camera, time)` pairs.
+        :rtype: iterator
+        '''
+        images = deque()
+        for camera, time in requests:
+            images.append(self.render(camera, time))
+            if len(images) >= 2 * len(self._workers):
+                yield images.popleft().result()
+        while len(images) > 0:
+            yield images.popleft().result()
+
+    def close(self):
+        '''
+        Shut down every server in the pool.
+        '''
+        for worker in self._workers:
+            worker.connection.shut_down()
+        self._workers = []
@@ -1,5 +1,9 @@
+from collections import OrderedDict
+from functools import partial
 from numpy import array
-from _core import BlenderModule, BlenderResource
+from _core import (BlenderFuture, BlenderModule, BlenderResource,
+                   accessing_properties, get_cached, invalidate_properties,
+                   set_cached, set_properties, update_cached)
 
 __name__ = 'fauxton'
 __all__ = ['Action', 'Prop', 'Scene', 'read_scene', 'write_scene']
@@ -20,8 +24,12 @@ bl_prop = BlenderModule('''
     def set_position(prop, position):
         prop.location = position
 
+    def use_quaternions(prop):
+        if prop.rotation_mode != 'QUATERNION':
+            prop.rotation_mode = 'QUATERNION'
+
     def get_rotation(prop):
-        prop.rotation_mode = 'QUATERNION'
+        use_quaternions(prop)
         return list(prop.rotation_quaternion)
 
     def set_rotation(prop, rotation):
@@ -35,70 +43,94 @@ bl_prop = BlenderModule('''
         prop.scale = scale
 
     def get_action(prop):
-        prop.rotation_mode = 'QUATERNION'
+        use_quaternions(prop)
         return prop.animation_data.action if prop.animation_data else None
 
     def set_action(prop, action):
         if prop.animation_data is None:
             prop.animation_data_create()
         prop.rotation_mode = 'QUATERNION'
+        if prop.animation_data.action is not None:
+            add_gc_candidate(prop.animation_data.action)
         prop.animation_data.action = action
-  ''')
+  ''', name='bl_prop')
 
 bl_action = BlenderModule('''
+    from numpy import asarray, concatenate, empty, unique
+
+    KEYFRAME_DEFAULTS = {
+        'location': (0, 0, 0), 'rotation_quaternion': (1, 0, 0, 0),
+        'scale': (1, 1, 1)}
+
     def create(type_):
         action = bpy.data.actions.new('')
         action['__type__'] = type_
         return action
 
+    def get_keyframes(action, data_path, size):
+        curves = [c for c in action.fcurves
+                  if c.data_path == data_path and c.array_index < size]
+        keyframes = []
+        for curve in curves:
+            co = empty(2 * len(curve.keyframe_points), 'f')
+            curve.keyframe_points.foreach_get('co', co)
+            keyframes.append(co.reshape(-1, 2))
+        times = unique(concatenate([k[:, 0] for k in keyframes]
+                                   + [empty(0, 'f')]))
+        points = empty((len(times), 1 + size), 'f')
+        points[:, 0] = times
+        points[:, 1:] = KEYFRAME_DEFAULTS[data_path]
+        for curve, co in zip(curves, keyframes):
+            column = points[:, 1 + curve.array_index]
+            if len(co) == len(times) and (co[:, 0] == times).all():
+                column[:] = co[:, 1]
+            else:
+                column[:] = [curve.evaluate(t) for t in times]
+        return points
+
+    def set_keyframes(action, data_path, size, points):
+        points = asarray(points, 'f').reshape(-1, 1 + size)
+        for curve in list(action.fcurves):
+            if curve.data_path == data_path:
+                action.fcurves.remove(curve)
+        co = empty((len(points), 2), 'f')
+        co[:, 0] = points[:, 0]
+        for i in range(size):
+            co[:, 1] = points[:, 1 + i]
+            curve = action.fcurves.new(data_path, i)
+            curve.keyframe_points.add(len(points))
+            curve.keyframe_points.foreach_set('co', co.ravel())
+            curve.keyframe_points.foreach_set('handle_left', co.ravel())
+            curve.keyframe_points.foreach_set('handle_right', co.ravel())
+            for point in curve.keyframe_points:
+                point.interpolation = 'LINEAR'
+
     def get_position(action):
-        return action.get('position', [])
+        return get_keyframes(action, 'location', 3)
 
     def set_position(action, position):
-        action['position'] = position
-        for curve in list(action.fcurves):
-            if curve.data_path == 'location':
-                action.fcurves.remove(curve)
-        for i in range(3):
-            curve = action.fcurves.new('location', i)
-            curve.keyframe_points.add(len(position))
-            for j, point in enumerate(position):
-                curve.keyframe_points[j].co = point[0], point[1 + i]
-                curve.keyframe_points[j].interpolation = 'LINEAR'
+        set_keyframes(action, 'location', 3, position)
 
     def get_rotation(action):
-        return action.get('rotation', [])
+        return get_keyframes(action, 'rotation_quaternion', 4)
 
     def set_rotation(action, rotation):
-        action['rotation'] = rotation
-        for curve in list(action.fcurves):
-            if curve.data_path == 'rotation_quaternion':
-                action.fcurves.remove(curve)
-        for i in range(4):
-            curve = action.fcurves.new('rotation_quaternion', i)
-            curve.keyframe_points.add(len(rotation))
-            for j, point in enumerate(rotation):
-                curve.keyframe_points[j].co = point[0], point[1 + i]
-                curve.keyframe_points[j].interpolation = 'LINEAR'
+        set_keyframes(action, 'rotation_quaternion', 4, rotation)
 
     def get_scale(action):
-        return action.get('scale', [])
+        return get_keyframes(action, 'scale', 3)
 
     def set_scale(action, scale):
-        action['scale'] = scale
-        for curve in list(action.fcurves):
-            if curve.data_path == 'scale':
-                action.fcurves.remove(curve)
-        for i in range(3):
-            curve = action.fcurves.new('scale', i)
-            curve.keyframe_points.add(len(scale))
-            for j, point in enumerate(scale):
-                curve.keyframe_points[j].co = point[0], point[1 + i]
-                curve.keyframe_points[j].interpolation = 'LINEAR'
-  ''')
+        set_keyframes(action, 'scale', 3, scale)
+  ''', name='bl_action')
 
 bl_scene = BlenderModule('''
-    from random import randint
+    from os.path import abspath, getmtime
+    from numpy import empty, hstack
+
+    POSE_FIELDS = [('location', 3), ('rotation_quaternion', 4), ('scale', 3)]
+
+    scene_templates = {}
 
     def create(type_):
         scene = bpy.data.scenes.new('')
@@ -115,6 +147,11 @@ bl_scene = BlenderModule('''
     def get_prop_names(scene):
         return scene['global_names'].keys()
 
+    def get_items(scene):
+        global_names = scene['global_names']
+        return [(name, bpy.data.objects[global_names[name]])
+                for name in global_names.keys()]
+
     def contains(scene, name):
         return name in scene['global_names']
 
@@ -124,27 +161,73 @@ bl_scene = BlenderModule('''
 
     def set_by_name(scene, name, prop):
         if contains(scene, name):
-            scene.objects.unlink(get_by_name(scene, name))
+            old_prop = get_by_name(scene, name)
+            scene.objects.unlink(old_prop)
+            add_gc_candidate(old_prop)
         scene.objects.link(prop)
         scene['global_names'][name] = prop.name
         scene['local_names'][prop.name] = name
 
+    def get_name(scene, prop):
+        return scene['local_names'][prop.name]
+
     def remove_by_name(scene, name):
         prop = get_by_name(scene, name)
         scene.objects.unlink(prop)
+        add_gc_candidate(prop)
         del scene['global_names'][name]
         del scene['local_names'][prop.name]
 
+    def allocate_name(scene):
+        name_count = scene.get('name_count', 0)
+        while str(name_count) in scene['global_names']:
+            name_count += 1
+        scene['name_count'] = name_count + 1
+        return str(name_count)
+
     def add(scene, prop):
-        def unused_name():
-            name = str(randint(0, 2*32))
-            return name if name not in scene['global_names'] else unused_name()
-        set_by_name(scene, unused_name(), prop)
-        return prop
+        name = allocate_name(scene)
+        set_by_name(scene, name, prop)
+        return name
 
     def remove(scene, prop):
-        remove_by_key(scene['local_names'][prop])
-        return prop
+        name = get_name(scene, prop)
+        remove_by_name(scene, name)
+        return name
+
+    def get_pose_fields(scene, names):
+        if names is None:
+            names = list(scene['global_names'].keys())
+        indices = {o.name: i for i, o in enumerate(scene.objects)}
+        global_names = scene['global_names']
+        rows = [indices[global_names[n]] for n in names]
+        fields = []
+        for field, size in POSE_FIELDS:
+            values = empty(size * len(scene.objects), 'f')
+            scene.objects.foreach_get(field, values)
+            fields.append(values.reshape(-1, size))
+        return rows, fields
+
+    def use_quaternions(props):
+        for prop in props:
+            if prop.rotation_mode != 'QUATERNION':
+                prop.rotation_mode = 'QUATERNION'
+
+    def get_poses(scene, names):
+        use_quaternions(scene.objects)
+        rows, fields = get_pose_fields(scene, names)
+        return hstack([f[rows] for f in fields]).astype('d')
+
+    def set_poses(scene, names, poses):
+        use_quaternions(scene.objects)
+        rows, fields = get_pose_fields(scene, names)
+        start = 0
+        for (field, size), values in zip(POSE_FIELDS, fields):
+            values[rows] = poses[:, start:start+size]
+            scene.objects.foreach_set(field, values.ravel())
+            start += size
+        objects = list(scene.objects)
+        for row in rows: objects[row].update_tag()
 
     def get_time(scene):
         return scene.frame_current
@@ -152,18 +235,63 @@ bl_scene = BlenderModule('''
     def set_time(scene, time):
         scene.frame_current = time
 
-    def read(path):
+    def load(path):
         with bpy.data.libraries.load(path) as (src, dst):
-            local_names = list(src.objects)
+            file_names = list(src.objects)
             dst.scenes = [src.scenes[0]]
             dst.objects = src.objects
         scene = dst.scenes[0]
-        global_names = [o.name for o in dst.objects]
-        scene['global_names'] = dict(zip(local_names, global_names))
-        scene['local_names'] = dict(zip(global_names, local_names))
+        names = dict(zip(file_names, [o.name for o in dst.objects]))
+        stored_names = dict(scene.get('global_names', {}).items())
+        if not (stored_names and set(stored_names.values()) <= set(names)):
+            stored_names = dict(zip(file_names, file_names))
+        global_names = {local_name: names[file_name]
+                        for local_name, file_name in stored_names.items()}
+        scene['global_names'] = global_names
+        scene['local_names'] = {v: k for k, v in global_names.items()}
+        return scene
+
+    def get_template(path):
+        path = abspath(path)
+        mtime, template = scene_templates.get(path, (None, None))
+        if template is None or mtime != getmtime(path):
+            if template is not None:
+                template.use_fake_user = False
+                add_gc_candidate(template)
+            mtime, template = getmtime(path), load(path)
+            for prop in template.objects:
+                if '__local_name__' in prop:
+                    del prop['__local_name__']
+            for name, prop in get_items(template):
+                prop['__local_name__'] = name
+            template.use_fake_user = True
+            scene_templates[path] = mtime, template
+        return template
+
+    def read(path, linked=False):
+        bpy.context.screen.scene = get_template(path)
+        bpy.ops.scene.new(type='LINK_OBJECT_DATA' if linked else 'FULL_COPY')
+        scene = bpy.context.screen.scene
+        scene.use_fake_user = False
+        for prop in scene.objects:
+            if linked and prop.data is not None and prop.type != 'MESH':
+                prop.data = prop.data.copy()
+            animation_data = prop.animation_data
+            if animation_data is not None and animation_data.action is not None:
+                animation_data.action = animation_data.action.copy()
+        global_names = {p['__local_name__']: p.name for p in scene.objects
+                        if '__local_name__' in p}
+        scene['global_names'] = global_names
+        scene['local_names'] = {v: k for k, v in global_names.items()}
         return scene
 
     def write(path, scene):
+        if hasattr(bpy.data.libraries, 'write'):
+            bpy.data.libraries.write(path, {scene} | set(scene.objects))
+        else:
+            write_main_file(path, scene)
+
+    def write_main_file(path, scene):
         conflicting_scene = bpy.data.scenes.get('0', None)
         if conflicting_scene: conflicting_scene.name = ''
         old_scene_name = scene.name
@@ -188,7 +316,19 @@ bl_scene = BlenderModule('''
     
         if conflicting_scene: conflicting_scene.name = '0'
         scene.name = old_scene_name
-  ''')        
+  ''', name='bl_scene')        
+
+def get_prop_index(scene):
+    fetch = lambda: OrderedDict(bl_scene.get_items.submit(scene).result())
+    return get_cached(scene, 'prop_index', fetch, always=True)
+
+POSE_INDEPENDENT_PROPERTIES = ('prop_index',)
+
+def update_prop_index(scene, prop, update):
+    if isinstance(prop, BlenderFuture):
+        invalidate_properties(scene)
+    else:
+        update_cached(scene, 'prop_index', update)
 
 #===============================================================================
 # Public Symbols
@@ -211,32 +351,38 @@ class Prop(BlenderResource):
 
     def __new__(cls, data=None, **properties):
         result = bl_prop.create(cls.resource_type, data)
-        [setattr(result, k, v) for k, v in properties.items()]
+        set_properties(cls, result, properties)
         return result
 
     @property
     def position(self):
-        return array(bl_prop.get_position(self))
+        fetch = lambda: array(bl_prop.get_position(self))
+        return get_cached(self, 'position', fetch)
 
     @position.setter
     def position(self, position):
-        bl_prop.set_position(self, list(map(float, position)))
+        store = partial(bl_prop.set_position, self)
+        set_cached(self, 'position', array(position, 'd'), store)
 
     @property
     def rotation(self):
-        return array(bl_prop.get_rotation(self))
+        fetch = lambda: array(bl_prop.get_rotation(self))
+        return get_cached(self, 'rotation', fetch)
 
     @rotation.setter
     def rotation(self, rotation):
-        bl_prop.set_rotation(self, list(map(float, rotation)))
+        store = partial(bl_prop.set_rotation, self)
+        set_cached(self, 'rotation', array(rotation, 'd'), store)
 
     @property
     def scale(self):
-        return array(bl_prop.get_scale(self))
+        fetch = lambda: array(bl_prop.get_scale(self))
+        return get_cached(self, 'scale', fetch)
 
     @scale.setter
     def scale(self, scale):
-        bl_prop.set_scale(self, list(map(float, scale)))
+        store = partial(bl_prop.set_scale, self)
+        set_cached(self, 'scale', array(scale, 'd'), store)
 
     @property
     def pose(self):
@@ -252,7 +398,7 @@ class Prop(BlenderResource):
 
     @action.setter
     def action(self, action):
-        if not isinstance(action, Action):
+        if not isinstance(action, (Action, BlenderFuture)):
             action = Action(action)
         bl_prop.set_action(self, action)
 
@@ -270,7 +416,7 @@ class Action(BlenderResource):
 
     def __new__(cls, **properties):
         result = bl_action.create(cls.resource_type)
-        [setattr(result, k, v) for k, v in properties.items()]
+        set_properties(cls, result, properties)
         return result
 
     @property
@@ -279,7 +425,8 @@ class Action(BlenderResource):
 
     @position.setter
     def position(self, position):
-        bl_action.set_position(self, [list(map(float, e)) for e in position])
+        bl_action.set_position(self, array(position, 'f'))
+        invalidate_properties(kept_names=POSE_INDEPENDENT_PROPERTIES)
 
     @property
     def rotation(self):
@@ -287,7 +434,8 @@ class Action(BlenderResource):
 
     @rotation.setter
     def rotation(self, rotation):
-        bl_action.set_rotation(self, [list(map(float, e)) for e in rotation])
+        bl_action.set_rotation(self, array(rotation, 'f'))
+        invalidate_properties(kept_names=POSE_INDEPENDENT_PROPERTIES)
 
     @property
     def scale(self):
@@ -295,7 +443,8 @@ class Action(BlenderResource):
 
     @scale.setter
     def scale(self, scale):
-        bl_action.set_scale(self, [list(map(float, e)) for e in scale])
+        bl_action.set_scale(self, array(scale, 'f'))
+        invalidate_properties(kept_names=POSE_INDEPENDENT_PROPERTIES)
 
 class Scene(BlenderResource):
     '''
@@ -317,26 +466,32 @@ class Scene(BlenderResource):
 
     def __new__(cls, **properties):
         result = bl_scene.create(cls.resource_type)
-        [setattr(result, k, v) for k, v in properties.items()]
+        set_properties(cls, result, properties)
         return result
 
     def __len__(self):
-        return bl_scene.get_size(self)
+        return len(get_prop_index(self))
 
     def __iter__(self):
-        return iter(bl_scene.get_prop_names(self))
+        return iter(list(get_prop_index(self)))
 
     def __contains__(self, name):
-        return bl_scene.contains(self, name)
+        return name in get_prop_index(self)
 
     def __getitem__(self, name):
-        return bl_scene.get_by_name(self, name)
+        return get_prop_index(self)[name]
 
     def __setitem__(self, name, prop):
-        bl_scene.set_by_name(self, name, prop)
+        with accessing_properties():
+            bl_scene.set_by_name(self, name, prop)
+        update = lambda index: index.__setitem__(name, prop)
+        update_prop_index(self, prop, update)
 
     def __delitem__(self, name):
-        bl_scene.remove_by_name(self, name)
+        with accessing_properties():
+            bl_scene.remove_by_name(self, name)
+        update = lambda index: index.pop(name, None)
+        update_prop_index(self, None, update)
 
     @property
     def time(self):
@@ -344,7 +499,37 @@ class Scene(BlenderResource):
 
     @time.setter
     def time(self, time):
-        bl_scene.set_time(self, float(time))
+        with accessing_properties():
+            bl_scene.set_time(self, float(time))
+        invalidate_properties(kept_names=POSE_INDEPENDENT_PROPERTIES)
+
+    def get_poses(self, names=None):
+        '''
+        Return the poses of several props in a single call.
+
+        Each row of the result is the `position`, `rotation`, and `scale` of
+        a prop, concatenated.
+
+        :param list names: Names of the props, or `None` for every prop, in
+            the order `iter` would produce.
+        :rtype: numpy.ndarray
+        '''
+        if names is not None:
+            names = list(names)
+        with accessing_properties():
+            return bl_scene.get_poses(self, names)
+
+    def set_poses(self, names, poses):
+        '''
+        Set the poses of several props in a single call.
+
+        :param list names: Names of the props.
+        :param numpy.ndarray poses: One row per prop, formatted as in
+            `get_poses`.
+        '''
+        with accessing_properties():
+            bl_scene.set_poses(self, list(names), array(poses, 'd'))
+        invalidate_properties(kept_names=POSE_INDEPENDENT_PROPERTIES)
 
     def add(self, prop):
         '''
@@ -353,7 +538,11 @@ class Scene(BlenderResource):
         :param Prop prop: Prop to add.
         :rtype: Prop
         '''
-        return bl_scene.add(self, prop)
+        with accessing_properties():
+            name = bl_scene.add(self, prop)
+        update = lambda index: index.__setitem__(name, prop)
+        update_prop_index(self, prop, update)
+        return prop
 
     def remove(self, prop):
         '''
@@ -362,21 +551,40 @@ class Scene(BlenderResource):
         :param Prop prop: Prop to remove.
         :rtype: Prop
         '''
-        return bl_scene.remove(self, prop)
+        with accessing_properties():
+            name = bl_scene.remove(self, prop)
+        update = lambda index: index.pop(name, None)
+        update_prop_index(self, name, update)
+        return prop
 
-def read_scene(path):
+    def items(self):
+        '''
+        Return a list of `(name, prop)` pairs, 1 for each prop in the scene.
+
+        :rtype: list
+        '''
+        return list(get_prop_index(self).items())
+
+def read_scene(path, linked=False):
     '''
     Read a scene from a ".blend" file into memory.
 
+    Each file is loaded once and kept in memory until it is modified; every
+    read returns a new copy of its first scene. If `linked` is true, the copy
+    shares its meshes, materials, and images with the file's other copies.
+
     :param str path: Location on the filesystem.
+    :param bool linked: Whether to share meshes, materials, and images.
     :rtype: Scene
     '''
-    return bl_scene.read(path)
+    return bl_scene.read(path, linked)
 
 def write_scene(path, scene):
     '''
     Write a scene in memory to a ".blend" file.
 
+    Only the scene and the datablocks it uses are written.
+
     :param str path: Location on the filesystem.
     :param Scene scene: Scene to write.
     '''
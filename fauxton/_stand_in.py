@@ -0,0 +1,267 @@
+__name__ = 'fauxton'
+__all__ = []
+
+#===============================================================================
+# Private Symbols
+#===============================================================================
+
+STAND_IN_SOURCE = '''
+"""
+A lightweight imitation of Blender's `bpy` module.
+
+It models the datablocks Fauxton's scene logic uses (objects, scenes,
+actions, and worlds), with user counting, so that the server's resource
+management runs unmodified. It does not render.
+"""
+from types import SimpleNamespace
+
+#===============================================================================
+# Define datablocks.
+#===============================================================================
+
+class bpy_struct(object):
+    pass
+
+class ID(bpy_struct):
+    def __init__(self, name, type_=None):
+        self.name = name
+        self.users = 0
+        self.use_fake_user = False
+        self._properties = {}
+        if type_ is not None:
+            self.type = type_
+
+    def __contains__(self, key):
+        return key in self._properties
+
+    def __getitem__(self, key):
+        return self._properties[key]
+
+    def __setitem__(self, key, value):
+        self._properties[key] = value
+
+    def __delitem__(self, key):
+        del self._properties[key]
+
+    def get(self, key, default=None):
+        return self._properties.get(key, default)
+
+    def keys(self):
+        return self._properties.keys()
+
+    def items(self):
+        return self._properties.items()
+
+    def release(self):
+        pass
+
+def use(old_datablock, new_datablock):
+    if old_datablock is not None:
+        old_datablock.users -= 1
+    if new_datablock is not None:
+        new_datablock.users += 1
+    return new_datablock
+
+class World(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.horizon_color = (0.0, 0.0, 0.0)
+
+class Keyframe(object):
+    def __init__(self):
+        self.co = [0.0, 0.0]
+        self.handle_left = [0.0, 0.0]
+        self.handle_right = [0.0, 0.0]
+        self.interpolation = 'BEZIER'
+
+class Keyframes(list):
+    def add(self, count):
+        self.extend(Keyframe() for i in range(count))
+
+    def foreach_get(self, attribute, values):
+        for i, keyframe in enumerate(self):
+            values[2*i:2*i+2] = getattr(keyframe, attribute)
+
+    def foreach_set(self, attribute, values):
+        for i, keyframe in enumerate(self):
+            setattr(keyframe, attribute, [float(v) for v in values[2*i:2*i+2]])
+
+class FCurve(object):
+    def __init__(self, data_path, array_index):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.keyframe_points = Keyframes()
+
+class FCurves(list):
+    def new(self, data_path, index=0):
+        curve = FCurve(data_path, index)
+        self.append(curve)
+        return curve
+
+class Action(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.fcurves = FCurves()
+
+class AnimData(object):
+    def __init__(self):
+        self._action = None
+
+    @property
+    def action(self):
+        return self._action
+
+    @action.setter
+    def action(self, action):
+        self._action = use(self._action, action)
+
+class Object(ID):
+    def __init__(self, name, object_data=None):
+        ID.__init__(self, name)
+        self.data = use(None, object_data)
+        self.type = ('EMPTY' if object_data is None
+                     else type(object_data).__name__.upper())
+        self.location = [0.0, 0.0, 0.0]
+        self.rotation_mode = 'XYZ'
+        self.rotation_quaternion = [1.0, 0.0, 0.0, 0.0]
+        self.scale = [1.0, 1.0, 1.0]
+        self.animation_data = None
+        self.users_scene = []
+        self.modifiers = []
+        self.parent = None
+        self.hide_render = False
+
+    def animation_data_create(self):
+        self.animation_data = AnimData()
+        return self.animation_data
+
+    def update_tag(self):
+        pass
+
+    def release(self):
+        use(self.data, None)
+        if self.animation_data is not None:
+            self.animation_data.action = None
+
+class SceneObjects(object):
+    def __init__(self, scene):
+        self.scene = scene
+        self.objects = []
+
+    def __iter__(self):
+        return iter(list(self.objects))
+
+    def __len__(self):
+        return len(self.objects)
+
+    def link(self, obj):
+        self.objects.append(use(None, obj))
+        obj.users_scene.append(self.scene)
+
+    def unlink(self, obj):
+        self.objects.remove(obj)
+        obj.users_scene.remove(self.scene)
+        use(obj, None)
+
+    def foreach_get(self, attribute, values):
+        position = 0
+        for obj in self.objects:
+            value = getattr(obj, attribute)
+            values[position:position+len(value)] = value
+            position += len(value)
+
+    def foreach_set(self, attribute, values):
+        position = 0
+        for obj in self.objects:
+            size = len(getattr(obj, attribute))
+            value = [float(v) for v in values[position:position+size]]
+            setattr(obj, attribute, value)
+            position += size
+
+class Scene(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.objects = SceneObjects(self)
+        self.camera = None
+        self.frame_current = 1
+        self._world = None
+
+    @property
+    def world(self):
+        return self._world
+
+    @world.setter
+    def world(self, world):
+        self._world = use(self._world, world)
+
+    def frame_set(self, frame):
+        self.frame_current = frame
+
+    def release(self):
+        for obj in self.objects:
+            self.objects.unlink(obj)
+        self.world = None
+
+#===============================================================================
+# Define the main database.
+#===============================================================================
+
+COLLECTION_NAMES = {
+    'Action': 'actions', 'Armature': 'armatures', 'Brush': 'brushes',
+    'Camera': 'cameras', 'Curve': 'curves', 'VectorFont': 'fonts',
+    'GreasePencil': 'grease_pencil', 'Group': 'groups', 'Image': 'images',
+    'Lamp': 'lamps', 'Lattice': 'lattices', 'Library': 'libraries',
+    'FreestyleLineStyle': 'linestyles', 'Mask': 'masks',
+    'Material': 'materials', 'Mesh': 'meshes', 'MetaBall': 'metaballs',
+    'MovieClip': 'movieclips', 'NodeTree': 'node_groups',
+    'Object': 'objects', 'ParticleSettings': 'particles',
+    'Scene': 'scenes', 'Screen': 'screens', 'Sound': 'sounds',
+    'Speaker': 'speakers', 'Text': 'texts', 'Texture': 'textures',
+    'WindowManager': 'window_managers', 'World': 'worlds'}
+
+class Collection(object):
+    def __init__(self, type_):
+        self.type = type_
+        self.datablocks = {}
+        self.suffixes = {}
+
+    def __getitem__(self, name):
+        return self.datablocks[name]
+
+    def __contains__(self, name):
+        return name in self.datablocks
+
+    def __iter__(self):
+        return iter(list(self.datablocks.values()))
+
+    def __len__(self):
+        return len(self.datablocks)
+
+    def get(self, name, default=None):
+        return self.datablocks.get(name, default)
+
+    def keys(self):
+        return list(self.datablocks.keys())
+
+    def new(self, name, *arguments):
+        base_name = name or self.type.__name__
+        name = base_name
+        while name in self.datablocks:
+            self.suffixes[base_name] = self.suffixes.get(base_name, 0) + 1
+            name = '%s.%03d' % (base_name, self.suffixes[base_name])
+        self.datablocks[name] = self.type(name, *arguments)
+        return self.datablocks[name]
+
+    def remove(self, datablock):
+        del self.datablocks[datablock.name]
+        datablock.release()
+
+types = SimpleNamespace(bpy_struct=bpy_struct, ID=ID)
+data = SimpleNamespace()
+defined_types = {t.__name__: t for t in (World, Action, Object, Scene)}
+for type_name, collection_name in COLLECTION_NAMES.items():
+    type_ = defined_types.get(type_name, None) or type(type_name, (ID,), {})
+    setattr(types, type_name, type_)
+    setattr(data, collection_name, Collection(type_))
+context = SimpleNamespace(scene=None)
+'''